@@ -0,0 +1,151 @@
+"""
+Colour classification for the auxiliary colour sensors.
+
+Robot.read_colour() and watch_colour() classify through a ColourClassifier, which Robot
+builds on first use, and watch_colour() reports through a ColourWatch.
+"""
+
+from pybricks.parameters import Color
+
+
+class ColourClassifier:
+    """
+    Classifies ColorSensor.rgb() readings by the nearest calibrated colour.
+
+    The nearest colour of every (r, g, b) cell, 8 units wide per channel, is worked out once
+    into a 4096-entry lookup table, so classifying a reading is three shifts and an index.
+    Building the table compares every cell with every colour, which takes milliseconds on a
+    PC and far longer on the brick, so call prepare() before the mission, after the last
+    calibrate(). Otherwise the first classification after the colours change pays for it.
+    Cells further than max_distance from every colour classify as None.
+
+    The default colours are rough EV3 readings of LEGO bricks at a few mm; calibrate() the
+    ones that matter on the real objects.
+
+    Parameters:
+    - colours: optional {Color: (r, g, b)} replacing the defaults
+    - max_distance: float, largest distance in rgb units from a colour that still matches it
+    """
+
+    DEFAULT_COLOURS = {
+        Color.BLACK: (5, 5, 6),
+        Color.WHITE: (80, 80, 80),
+        Color.RED: (70, 10, 8),
+        Color.GREEN: (10, 50, 15),
+        Color.BLUE: (8, 15, 60),
+        Color.YELLOW: (75, 65, 10),
+        Color.BROWN: (35, 20, 10),
+    }
+
+    def __init__(self, colours=None, max_distance=40):
+        self.colours = dict(colours if colours is not None else self.DEFAULT_COLOURS)
+        self.max_distance = max_distance
+        self.table = None
+        self.names = []
+        self.votes = bytearray(0)
+
+    def calibrate(self, colour, rgb):
+        """Sets the (r, g, b) reading of a colour, adding it if it is new."""
+        self.colours[colour] = tuple(rgb)
+        self.table = None
+
+    def prepare(self):
+        """Builds the lookup table now unless it is up to date with the colours."""
+        if self.table is None:
+            self.build()
+
+    def build(self):
+        """Builds the lookup table, as prepare() and classify() do when the colours have changed."""
+        names = list(self.colours)
+        centres = [self.colours[name] for name in names]
+        limit = self.max_distance * self.max_distance
+        table = bytearray(4096)
+        for r in range(16):
+            for g in range(16):
+                for b in range(16):
+                    # Centre of the cell
+                    cr, cg, cb = 8 * r + 4, 8 * g + 4, 8 * b + 4
+                    best = 255
+                    best_distance = limit
+                    for i, (tr, tg, tb) in enumerate(centres):
+                        dr, dg, db = cr - tr, cg - tg, cb - tb
+                        distance = dr * dr + dg * dg + db * db
+                        if distance <= best_distance:
+                            best = i
+                            best_distance = distance
+                    table[(r << 8) | (g << 4) | b] = best
+        self.names = names
+        self.votes = bytearray(len(names))
+        self.table = table
+
+    def index(self, rgb):
+        """Returns the table index of an (r, g, b) reading, 255 for no colour."""
+        r, g, b = rgb
+        if r > 127: r = 127
+        if g > 127: g = 127
+        if b > 127: b = 127
+        return self.table[((r >> 3) << 8) | ((g >> 3) << 4) | (b >> 3)]
+
+    def classify(self, read_rgb, samples=5):
+        """
+        Reads up to `samples` readings back to back and returns (colour, confidence), where
+        confidence is the share of the readings taken that voted for the colour. Reading stops
+        as soon as no other colour could catch up with the readings left, so a clear colour
+        costs a bare majority of reads at confidence 1 and a mixed burst reads on and reports
+        its disagreement. (None, 0) when nothing matched.
+
+        Parameters:
+        - read_rgb: function returning an (r, g, b) reading, e.g. ColorSensor.rgb
+        - samples: int, most readings to take
+        """
+        if self.table is None:
+            self.build()
+        votes = self.votes
+        for i in range(len(votes)):
+            votes[i] = 0
+        index = self.index
+        remaining = samples
+        while remaining:
+            remaining -= 1
+            i = index(read_rgb())
+            if i == 255:
+                continue
+            votes[i] += 1
+            lead = votes[i] - remaining
+            if lead > 0:
+                for j in range(len(votes)):
+                    if j != i and votes[j] >= lead:
+                        break
+                else:
+                    return self.names[i], votes[i] / (samples - remaining)
+        best = 0
+        for i in range(1, len(votes)):
+            if votes[i] > votes[best]:
+                best = i
+        if not votes or votes[best] == 0:
+            return None, 0
+        return self.names[best], votes[best] / samples
+
+
+class ColourWatch:
+    """
+    Handle of a watch_colour() task: the colour an auxiliary sensor sees, kept up to date
+    while the robot drives.
+
+    `colour` and `confidence` are the majority over the last `samples` readings, or over the
+    readings taken so far while there are fewer. `history`
+    lists (time in ms, colour) each time the majority changes to a colour, None included,
+    whose confidence is at least min_confidence.
+    """
+
+    def __init__(self, samples, min_confidence):
+        self.samples = samples
+        self.min_confidence = min_confidence
+        self.colour = None
+        self.confidence = 0
+        self.history = []
+        self.running = True
+
+    def stop(self):
+        """Ends the task at its next step."""
+        self.running = False
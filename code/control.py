@@ -0,0 +1,196 @@
+"""
+Estimators of the line offset and its rate for the line-trace controller.
+
+Each tick the trace step hands the estimator the raw error and the true tick length, and
+reads back `offset` and `rate`, which the P and D terms act on. The rate is in error units
+per nominal loop period, so Kd means the same whatever the polling rate and however long
+a tick runs. Both are integers, and the state is kept as integers scaled by 256, so a tick
+does no float math and allocates nothing on the brick.
+
+An estimator holds all its state in a few attributes and is reset at the start of every
+trace, so one instance can be built once and passed to every call:
+
+    smooth = LowPass(20)
+    robot.line_trace_junction(2, 1.5, estimator=smooth, junction_threshold=12)
+    robot.line_trace_time(1000, 2, 1.5, estimator=smooth)
+
+A smoothed rate is smaller, so junction detection needs a lower threshold with it. In the
+simulator at 1000 deg/s with noisy sensors, the plain difference at the default threshold
+of 20 takes sensor noise for junctions, while LowPass(20) at 12 and AlphaBeta() at 14 only
+find the real one.
+
+- Difference: the plain one-sample difference, the default.
+- LowPass: the difference through a first-order low-pass filter with a time constant in ms.
+- AlphaBeta: an alpha-beta tracker that smooths the offset as well as the rate.
+"""
+
+SHIFT = 8  # Fixed-point scale of 256
+HALF = 1 << (SHIFT - 1)
+
+
+def fixed(value):
+    """Returns a float gain or fraction as an integer scaled by 256."""
+    return round(value * (1 << SHIFT))
+
+
+class Difference:
+    """
+    Rate as the change in error since the previous tick, per nominal period. The offset is
+    the error itself. Responds immediately, and passes all the sensor noise into the D term.
+    As the trace always has, the first tick measures its change from an error of 0.
+    """
+
+    def reset(self, period_us):
+        """
+        Clears the state. Called by the trace before its first tick with the nominal period
+        in microseconds, 0 for a free-running loop.
+        """
+        self.period_us = period_us
+        self.offset = 0
+        self.rate = 0
+        self._last = 0
+
+    def update(self, error, dt):
+        """
+        Takes the error of this tick and the tick length in microseconds, and sets offset
+        and rate.
+        """
+        rate = error - self._last
+        self._last = error
+        self.offset = error
+        if self.period_us and dt > 0:
+            rate = rate * self.period_us // dt
+        self.rate = rate
+
+
+class LowPass(Difference):
+    """
+    Rate as the one-sample difference through a first-order low-pass filter. Each tick
+    moves the rate dt / (time_constant + dt) of the way to the new difference, so a long
+    tick counts for more. The offset is the error itself.
+
+    Parameters:
+    - time_constant: float, filter time constant in ms; larger is smoother and slower
+    """
+
+    def __init__(self, time_constant=20):
+        self.time_constant_us = int(time_constant * 1000)
+
+    def reset(self, period_us):
+        # A free-running loop has no nominal period, so its rate is per ms
+        Difference.reset(self, period_us or 1000)
+        self._last = None
+        self._rate = 0  # Scaled by 256
+
+    def update(self, error, dt):
+        last = self._last
+        self._last = error
+        self.offset = error
+        if last is None or dt <= 0:
+            return
+        raw = ((error - last) << SHIFT) * self.period_us // dt
+        alpha = (dt << SHIFT) // (self.time_constant_us + dt)
+        state = self._rate + ((alpha * (raw - self._rate)) >> SHIFT)
+        self._rate = state
+        self.rate = (state + HALF) >> SHIFT
+
+
+class AlphaBeta(Difference):
+    """
+    Alpha-beta tracker of the line offset and its rate. Each tick predicts the offset from
+    the previous rate, then corrects the offset by alpha and the rate by beta times the
+    prediction error. Smaller gains reject more noise and lag more; beta below alpha keeps
+    the tracker stable.
+
+    Parameters:
+    - alpha: float, 0-1, offset correction gain
+    - beta: float, 0-1, rate correction gain
+    """
+
+    def __init__(self, alpha=0.6, beta=0.3):
+        self.alpha = fixed(alpha)
+        self.beta = fixed(beta)
+
+    def reset(self, period_us):
+        Difference.reset(self, period_us or 1000)
+        self._last = None
+        self._offset = 0  # Scaled by 256
+        self._rate = 0  # Scaled by 256, per nominal period
+
+    def update(self, error, dt):
+        period_us = self.period_us
+        measured = error << SHIFT
+        if self._last is None:
+            self._last = error
+            self._offset = measured
+            self.offset = error
+            return
+        self._last = error
+        if dt <= 0:
+            dt = period_us
+        predicted = self._offset + self._rate * dt // period_us
+        residual = measured - predicted
+        state = predicted + ((self.alpha * residual) >> SHIFT)
+        rate = self._rate + ((self.beta * residual) >> SHIFT) * period_us // dt
+        self._offset = state
+        self._rate = rate
+        self.offset = (state + HALF) >> SHIFT
+        self.rate = (rate + HALF) >> SHIFT
+
+
+class AdaptiveRate:
+    """
+    A polling rate for the line traces that samples faster while the line is moving under
+    the sensors and slower on steady straights. Pass it as `polling_rate`.
+
+    Each tick the trace reports its activity, |offset| + |rate| from the estimator. The
+    next period falls linearly from max_period at no activity to min_period at
+    full_scale. It shortens at once and lengthens by an eighth of the gap per tick, so a
+    curve or junction is sampled fast straight away and a straight only slowly relaxes.
+    The traces also ask for min_period while a junction may be starting and near the end
+    of a distance. Kd and the estimators count their rate per nominal_period, so gains
+    tuned at a fixed polling rate carry over when nominal_period is set to it.
+
+    Pair it with LowPass or AlphaBeta: the plain difference is scaled up on short ticks,
+    noise and all, and takes more of it for junctions.
+
+    After the loop, Robot.loop_rate holds the rate achieved. Other closed-loop moves accept
+    an AdaptiveRate too, but nothing reports activity to it, so they run at max_period.
+
+    Parameters:
+    - min_period: float, shortest period in ms
+    - max_period: float, longest period in ms
+    - full_scale: int, activity at which the loop runs at min_period
+    - nominal_period: float, period in ms the rate and Kd are counted per
+    """
+
+    def __init__(self, min_period=5, max_period=15, full_scale=30, nominal_period=10):
+        if not 0 < min_period <= max_period:
+            raise ValueError("Need 0 < min_period <= max_period, got {} and {}.".format(min_period, max_period))
+        self.min_period = min_period
+        self.max_period = max_period
+        self.nominal_period = nominal_period
+        self.min_us = int(min_period * 1000)
+        self.max_us = int(max_period * 1000)
+        self.full_scale = full_scale
+        self.reset()
+
+    def reset(self):
+        """Starts at max_period. Called by the loop before its first tick."""
+        self.period_us = self.max_us
+
+    def note(self, activity):
+        """Sets the next period from this tick's activity."""
+        if activity >= self.full_scale:
+            target = self.min_us
+        else:
+            target = self.max_us - (self.max_us - self.min_us) * activity // self.full_scale
+        period_us = self.period_us
+        if target < period_us:
+            self.period_us = target
+        else:
+            self.period_us = period_us + ((target - period_us) >> 3)
+
+    def hurry(self):
+        """Runs the next tick at min_period."""
+        self.period_us = self.min_us
@@ -0,0 +1,264 @@
+"""
+Opt-in instruments for looking inside the control loops on the brick.
+
+- LoopProfiler: per-tick timings of a control loop, passed to Robot as `profiler`.
+- Telemetry: fixed-width records of every tick, passed to Robot as `telemetry` and decoded
+  on a host with `host/telemetry_decode.py`.
+- Recorder: the readings and commands of a run, for `host/replay.py`.
+
+None of them allocates while recording. They live apart from evpylib so a program that
+does not use them does not load them.
+"""
+
+from array import array
+import struct
+from evpylib import ticks_us, ticks_diff
+
+
+class LoopProfiler:
+    """
+    Records per-iteration timings of a control loop into preallocated arrays.
+
+    Each iteration is split into four marks: begin() at the top of the loop, sensed() after
+    the sensor reads, computed() after the control math and commanded() after the motor
+    commands. Recording never allocates; once `size` iterations are stored the buffer wraps.
+
+    Parameters:
+    - size: int, number of iterations kept
+    """
+
+    CHANNELS = ("period", "sensor", "compute", "motor")
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.period = array("l", [0] * size)
+        self.sensor = array("l", [0] * size)
+        self.compute = array("l", [0] * size)
+        self.motor = array("l", [0] * size)
+        self.start()
+
+    def start(self):
+        """Clears the recorded iterations. Called by Robot at the start of each loop."""
+        self.count = 0
+        self._index = -1
+        self._last_begin = None
+        self._mark = 0
+
+    def begin(self):
+        now = ticks_us()
+        last = self._last_begin
+        self._last_begin = now
+        self._mark = now
+        index = self._index + 1
+        if index == self.size:
+            index = 0
+        self._index = index
+        self.period[index] = ticks_diff(now, last) if last is not None else 0
+        self.sensor[index] = 0
+        self.compute[index] = 0
+        self.motor[index] = 0
+        self.count += 1
+
+    def sensed(self):
+        now = ticks_us()
+        self.sensor[self._index] = ticks_diff(now, self._mark)
+        self._mark = now
+
+    def computed(self):
+        now = ticks_us()
+        self.compute[self._index] = ticks_diff(now, self._mark)
+        self._mark = now
+
+    def commanded(self):
+        now = ticks_us()
+        self.motor[self._index] = ticks_diff(now, self._mark)
+        self._mark = now
+
+    def report(self):
+        """
+        Returns {channel: (min, mean, p99, max)} in microseconds over the stored iterations.
+        The first period is skipped since it has no previous iteration to measure from.
+        """
+        stored = min(self.count, self.size)
+        result = {}
+        for name in self.CHANNELS:
+            values = sorted(getattr(self, name)[i] for i in range(stored)
+                            if not (name == "period" and self.count <= self.size and i == 0))
+            if not values:
+                result[name] = (0, 0, 0, 0)
+                continue
+            p99 = values[min(len(values) - 1, (len(values) * 99) // 100)]
+            result[name] = (values[0], sum(values) / len(values), p99, values[-1])
+        return result
+
+    def print_report(self, label="loop"):
+        """Prints the report with the achieved loop rate and period jitter."""
+        stats = self.report()
+        period = stats["period"]
+        rate = 1000000 / period[1] if period[1] else 0
+        print("{}: {} iterations, {:.1f} Hz, jitter {} us".format(label, self.count, rate, period[3] - period[0]))
+        for name in self.CHANNELS:
+            print("  {:8} min {:6} mean {:8.1f} p99 {:6} max {:6} us".format(name, *stats[name]))
+
+
+class Telemetry:
+    """
+    Fixed-width telemetry records in a preallocated ring buffer, for hot loops where print()
+    is too slow and allocates.
+
+    Every record is a row of 32-bit ints, one per field. slot() hands out the index of the
+    next row in `data` for the caller to fill in, so writing a record allocates nothing.
+    Once `size` records are stored the oldest are overwritten. dump() writes the records
+    to a compact binary file that `host/telemetry_decode.py` turns into CSV or NumPy arrays.
+
+    Parameters:
+    - size: int, number of records kept
+    - fields: tuple of field names
+    """
+
+    MAGIC = b"EVTL"
+    VERSION = 1
+    TRACE_FIELDS = ("time", "left", "right", "error", "turn", "speed_left", "speed_right")
+
+    def __init__(self, size=2000, fields=TRACE_FIELDS):
+        self.size = size
+        self.fields = fields
+        self.width = len(fields)
+        self.data = array("i", [0] * (size * self.width))
+        self._end = size * self.width
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+
+    def slot(self):
+        """Returns the index in `data` of the next record's first field."""
+        index = self._next
+        following = index + self.width
+        self._next = 0 if following >= self._end else following
+        self.count += 1
+        return index
+
+    def dump(self, path):
+        """
+        Writes the stored records, oldest first, to `path`.
+
+        Layout, little-endian: magic "EVTL", u16 version, u16 field count, u32 record count,
+        u16 length of the comma-separated field names, the names, then the records.
+        """
+        stored = min(self.count, self.size)
+        names = ",".join(self.fields).encode()
+        view = memoryview(self.data)
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sHHIH", self.MAGIC, self.VERSION, self.width, stored, len(names)))
+            f.write(names)
+            if self.count > self.size:
+                f.write(view[self._next:])
+                f.write(view[:self._next])
+            else:
+                f.write(view[:stored * self.width])
+
+
+class Recorder:
+    """
+    Records what a Robot reads from its line sensors and encoders, and the speeds it
+    commands, with timestamps, so a run can be replayed on a host with `host/replay.py`.
+
+        recorder = Recorder()
+        robot = Robot(recorder.wrap(devices))
+        robot.line_trace_junction(1, 0.6)
+        recorder.dump("run.rec")
+
+    Every record is three 32-bit ints: microseconds since the recording started, channel
+    and value. The channel is 4 * device index + the index of the call in CALLS. The buffer
+    is preallocated; a replay needs a recording from its start, so once it is full further
+    records are discarded and counted in `dropped` rather than overwriting old ones.
+
+    Parameters:
+    - size: int, number of records kept
+    """
+
+    MAGIC = b"EVRC"
+    VERSION = 1
+    CALLS = ("reflection", "angle", "speed", "run")
+
+    def __init__(self, size=8000):
+        self.size = size
+        self.data = array("i", [0] * (3 * size))
+        self.names = []
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.dropped = 0
+        self._start = ticks_us()
+
+    def wrap(self, devices):
+        """
+        Returns a copy of a Robot devices dict whose devices record into this recorder.
+        """
+        wrapped = {}
+        for name, device in devices.items():
+            if device is None:
+                wrapped[name] = None
+                continue
+            if name not in self.names:
+                self.names.append(name)
+            wrapped[name] = _RecordedDevice(device, self, 4 * self.names.index(name))
+        return wrapped
+
+    def record(self, channel, value):
+        if self.count >= self.size:
+            self.dropped += 1
+            return
+        i = 3 * self.count
+        data = self.data
+        data[i] = ticks_diff(ticks_us(), self._start)
+        data[i + 1] = channel
+        data[i + 2] = int(value)
+        self.count += 1
+
+    def dump(self, path):
+        """
+        Writes the records to `path`.
+
+        Layout, little-endian: magic "EVRC", u16 version, u32 record count, u32 dropped
+        records, u16 length of the comma-separated device names, the names, then the records.
+        """
+        names = ",".join(self.names).encode()
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sHIIH", self.MAGIC, self.VERSION, self.count, self.dropped, len(names)))
+            f.write(names)
+            f.write(memoryview(self.data)[:3 * self.count])
+
+
+class _RecordedDevice:
+    """Passes calls through to a device, recording the readings and run() speeds."""
+
+    def __init__(self, device, recorder, channel):
+        self._device = device
+        self._record = recorder.record
+        self._channel = channel
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+    def reflection(self):
+        value = self._device.reflection()
+        self._record(self._channel, value)
+        return value
+
+    def angle(self):
+        value = self._device.angle()
+        self._record(self._channel + 1, value)
+        return value
+
+    def speed(self):
+        value = self._device.speed()
+        self._record(self._channel + 2, value)
+        return value
+
+    def run(self, speed):
+        self._device.run(speed)
+        self._record(self._channel + 3, speed)
@@ -1,31 +1,990 @@
 from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import Motor, ColorSensor
 from pybricks.parameters import Port, Stop
-from pybricks.tools import wait, StopWatch
+from pybricks.tools import StopWatch
+from array import array
+from math import sin, cos
+from motion import MotionProfile, Ramp
+from control import Difference, AdaptiveRate, fixed
+
+try:
+    from utime import ticks_us, ticks_diff, ticks_add, sleep_us
+except ImportError:
+    from time import perf_counter, sleep
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def sleep_us(us):
+        sleep(us / 1000000)
+
+
+class LoopTimer:
+    """
+    Paces a control loop at a fixed rate against absolute deadlines.
+
+    wait() sleeps only for what is left of the current period, so the time spent reading
+    sensors and driving motors no longer adds to the period. A tick that finishes after its
+    deadline counts as an overrun and the schedule skips ahead instead of bursting to catch up.
+
+    Parameters:
+    - period: float, loop period in ms
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.period_us = int(period * 1000)
+        self.start()
+
+    def start(self):
+        """Anchors the schedule at the current time and clears the counters."""
+        now = ticks_us()
+        self._deadline = ticks_add(now, self.period_us)
+        self._last = now
+        self.ticks = 0
+        self.overruns = 0
+        self.dt = self.period
+        self.dt_us = self.period_us
+
+    def wait(self):
+        """
+        Sleeps until the next deadline and returns the true time since the previous tick in ms.
+        """
+        now = ticks_us()
+        remaining = ticks_diff(self._deadline, now)
+        if remaining > 0:
+            sleep_us(remaining)
+            now = ticks_us()
+            self._deadline = ticks_add(self._deadline, self.period_us)
+        elif self.period_us:
+            self.overruns += 1
+            missed = -remaining // self.period_us + 1
+            self._deadline = ticks_add(self._deadline, missed * self.period_us)
+        self.dt_us = ticks_diff(now, self._last)
+        self.dt = self.dt_us / 1000
+        self._last = now
+        self.ticks += 1
+        return self.dt
+
+    def set_period_us(self, period_us):
+        """Changes the period from the next tick on, moving the pending deadline to match."""
+        if period_us != self.period_us:
+            self._deadline = ticks_add(self._deadline, period_us - self.period_us)
+            self.period_us = period_us
+
+
+class Odometry:
+    """
+    Dead-reckoned pose of the robot from its drive encoders.
+
+    update() takes both wheel angles every tick and integrates the change since the last
+    call, which costs a sine and a cosine. x and y are in mm from where tracking started,
+    x along the starting heading and y to its left; heading is in degrees, positive clockwise
+    like turn_arc; distance is the signed length of the path driven in mm.
+
+    Parameters:
+    - wheel_diameter: float, mm
+    - axle_track: float, effective distance between the wheels in mm
+    """
+
+    def __init__(self, wheel_diameter, axle_track):
+        self.mm_per_degree = 3.14159265 * wheel_diameter / 360
+        self.axle_track = axle_track
+        self._left = None
+        self._right = None
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        """Sets the pose, with heading in degrees, and zeroes the distance."""
+        self.x = x
+        self.y = y
+        self._heading = heading / 57.2957795
+        self.distance = 0.0
+
+    @property
+    def heading(self):
+        return self._heading * 57.2957795
+
+    def rebase(self, left_angle, right_angle):
+        """Takes new encoder readings as the reference without moving, e.g. after reset_angle()."""
+        self._left = left_angle
+        self._right = right_angle
+
+    def update(self, left_angle, right_angle):
+        last_left, last_right = self._left, self._right
+        self._left = left_angle
+        self._right = right_angle
+        if last_left is None or (left_angle == last_left and right_angle == last_right):
+            return
+        left = (left_angle - last_left) * self.mm_per_degree
+        right = (right_angle - last_right) * self.mm_per_degree
+        turn = (left - right) / self.axle_track
+        forward = (left + right) / 2
+        # Move along the mean heading of the step, which is exact for a circular arc's chord direction
+        mid = self._heading + turn / 2
+        self.x += forward * cos(mid)
+        self.y -= forward * sin(mid)
+        self._heading += turn
+        self.distance += forward
+
+
+class StallDetector:
+    """
+    Decides when a motor driven with run() has been stopped by something in its way.
+
+    update() is called every tick with the commanded speed. A tick looks stalled when the
+    measured speed is under `ratio` of the commanded speed (or under min_speed, whichever is
+    higher) and the encoder has also moved less than that over the last `window` ticks, or
+    when the motor's own controller reports a stall, where the firmware offers it. The motor
+    has stalled once stalled-looking ticks have run for confirm_time ms. Until the motor first
+    gets up to that speed, or spin_up ms have passed, nothing counts, so starting off is not
+    taken for a stall. The window is preallocated; a tick allocates nothing.
+
+    Parameters:
+    - motor: Motor to watch
+    - confirm_time: int, ms a stall has to last
+    - ratio: float, fraction of the commanded speed under which the motor counts as stopped
+    - window: int, ticks the encoder progress is measured over
+    - spin_up: int, ms after reset() that a motor still getting up to speed is given
+    - min_speed: float, deg/s under which the motor always counts as stopped
+    """
+
+    def __init__(self, motor, confirm_time=30, ratio=0.3, window=4, spin_up=200, min_speed=0):
+        self.read_speed = motor.speed
+        self.read_angle = motor.angle
+        try:
+            self.controller_stalled = motor.control.stalled
+        except AttributeError:
+            self.controller_stalled = None
+        self.confirm_time = confirm_time
+        self.ratio = ratio
+        self.window = window
+        self.spin_up = spin_up
+        self.min_speed = min_speed
+        self.angles = array("l", [0] * window)
+        self.times = array("l", [0] * window)
+        self.reset(0)
+
+    def reset(self, now):
+        """Starts watching afresh at time `now` in ms."""
+        self.start = now
+        self.count = 0
+        self.armed = False
+        self.since = None
+        self.stalled = False
+
+    def update(self, now, commanded):
+        """
+        Takes the time in ms and the speed the motor is commanded to run at, and returns True
+        once the motor has stalled.
+        """
+        speed = self.read_speed()
+        angle = self.read_angle()
+        if speed < 0: speed = -speed
+        i = self.count % self.window
+        oldest_angle = self.angles[i]
+        oldest_time = self.times[i]
+        self.angles[i] = angle
+        self.times[i] = now
+        self.count += 1
+
+        limit = self.ratio * (commanded if commanded > 0 else -commanded)
+        if limit < self.min_speed: limit = self.min_speed
+        if not self.armed:
+            if speed < limit and now - self.start < self.spin_up:
+                return False
+            self.armed = True
+
+        stopped = speed < limit
+        if stopped and self.count > self.window:
+            # Confirm on the encoder, which the speed estimate can lag
+            moved = angle - oldest_angle
+            if moved < 0: moved = -moved
+            stopped = 1000 * moved <= limit * (now - oldest_time)
+        if not stopped and self.controller_stalled:
+            stopped = self.controller_stalled()
+        if not stopped:
+            self.since = None
+            return False
+        if self.since is None:
+            self.since = now
+        self.stalled = now - self.since >= self.confirm_time
+        return self.stalled
+
+
+# Stop actions by the `then` names the Robot methods accept. "CONTINUE" has no entry:
+# the motors are left running and the next move takes over from their speed.
+_STOP_MODES = {"HOLD": Stop.HOLD, "STOP": Stop.COAST, "BRAKE": Stop.BRAKE}
+_STOP_METHODS = {"HOLD": "hold", "STOP": "stop", "BRAKE": "brake"}
+
+
+def _error_function(mode, TRACE_TARGET):
+    """
+    Returns a function (left_val, right_val) -> error for a line trace mode, so the mode
+    is resolved once per call instead of on every tick.
+    """
+    if mode == "balance":
+        # (TRACE_TARGET - left_val) - (TRACE_TARGET - right_val)
+        return lambda left_val, right_val: right_val - left_val
+    elif mode == "left_only":
+        return lambda left_val, right_val: TRACE_TARGET - left_val
+    elif mode == "right_only":
+        return lambda left_val, right_val: TRACE_TARGET - right_val
+    elif mode == "left_minus_right":
+        return lambda left_val, right_val: left_val - right_val
+    elif mode == "right_minus_left":
+        return lambda left_val, right_val: right_val - left_val
+    return lambda left_val, right_val: 0  # default no correction
+
+
+def _calibration_table(black, white):
+    """
+    Returns a bytearray mapping each raw reflection 0-100 to 0-100 between the black and
+    white readings, clamped outside them.
+    """
+    span = white - black
+    if span <= 0:
+        raise ValueError("White reading {} must be above black reading {}.".format(white, black))
+    table = bytearray(101)
+    for value in range(101):
+        scaled = (200 * (value - black) + span) // (2 * span)
+        table[value] = 0 if scaled < 0 else 100 if scaled > 100 else scaled
+    return table
+
+
+class Lazy:
+    """
+    A device built on first use instead of at startup, for the devices dict:
+
+        "aux_motor_1": Lazy(Motor, Port.D, positive_direction=Direction.CLOCKWISE),
+
+    Building a pybricks device probes its port, which adds to the time between starting a
+    program and the robot moving. Robot builds lazy drive motors and line sensors straight
+    away, and auxiliary devices the first time a method uses them. Any other attribute
+    access builds the device too, so code that uses the device directly keeps working.
+
+    Parameters:
+    - factory: device class or function
+    - args, kwargs: passed to factory
+    """
+
+    def __init__(self, factory, *args, **kwargs):
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs
+        self._device = None
+
+    def get(self):
+        """Returns the device, building it the first time."""
+        if self._device is None:
+            self._device = self._factory(*self._args, **self._kwargs)
+        return self._device
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+def _built(device):
+    """Returns the device behind a Lazy, building it, or the device itself."""
+    return device.get() if isinstance(device, Lazy) else device
+
+
+_ev3 = None  # The EV3Brick, shared by every Robot
+
 
 class Robot:
     def __init__(self, devices : dict, base_speed=1000, trace_speed=700, max_speed=1200, aux_speed = 200,
-                 turning_const=2.2, debug_mode=False):
+                 turning_const=2.2, debug_mode=False, profiler=None, telemetry=None, wheel_diameter=56,
+                 acceleration=None, jerk=None, axle_track=None):
 
-        self.ev3 = EV3Brick()
         self.debug_mode = debug_mode
+        self.profiler = profiler  # Optional diagnostics.LoopProfiler timing each control loop iteration
+        self.telemetry = telemetry  # Optional diagnostics.Telemetry recording each control loop iteration
 
-        self.left_motor = devices["left_motor"]
-        self.right_motor = devices["right_motor"]
-        self.aux_motor_1 = devices["aux_motor_1"]
+        self.left_motor = _built(devices["left_motor"])
+        self.right_motor = _built(devices["right_motor"])
+        self.aux_motor_1 = devices["aux_motor_1"]  # May be a Lazy until first used
         self.aux_motor_2 = devices["aux_motor_2"]
 
-        self.left_sensor = devices["left_sensor"]
-        self.right_sensor = devices["right_sensor"]
+        self.left_sensor = _built(devices["left_sensor"])
+        self.right_sensor = _built(devices["right_sensor"])
         self.aux_sensor_1 = devices["aux_sensor_1"]
         self.aux_sensor_2 = devices["aux_sensor_2"]
 
         self.watch = StopWatch()
+        # Shared by a loop's parts that read the same encoder, built when one first needs it,
+        # see _encoder_reads()
+        self.snapshot = None
         self.BASE_SPEED = base_speed
         self.TRACE_SPEED = trace_speed
         self.MAX_SPEED = max_speed
         self.AUX_SPEED = aux_speed
         self.TURN_CONST = turning_const
+        self.WHEEL_DIAMETER = wheel_diameter
+        # Motion profile limits in deg/s^2 and deg/s^3. With acceleration set, move_rotations,
+        # turn_arc and the move_time easing follow velocity profiles instead of fixed speeds.
+        self.ACCELERATION = acceleration
+        self.JERK = jerk
+        self._motor_speed_limit = None
+        # Forward wheel speed in deg/s that the last move left the motors running at, 0 after a
+        # stop: the mean of both wheels, and each wheel's own, which differ after an arc
+        self.handoff_speed = 0
+        self.handoff_speeds = (0, 0)
+        self.loop_rate = 0  # Ticks per second the last control loop achieved
+        self._tasks = []  # Background generators stepped by the control loops, see start()
+        self._colour_classifier = None
+        # Per-sensor tables mapping a raw reflection 0-100 to 0 on black and 100 on white,
+        # set by calibrate_sensors() or set_calibration(). None traces on the raw readings.
+        self.left_table = None
+        self.right_table = None
+        self.calibration = None  # (left_black, left_white, right_black, right_white) of the tables
+        # With the axle track known the turn constant follows from the geometry, and the robot
+        # tracks its pose so profiled moves can end on the estimated heading and distance.
+        self.odometry = None
+        if axle_track:
+            self.TURN_CONST = axle_track / wheel_diameter
+            self.odometry = Odometry(wheel_diameter, axle_track)
+            self.odometry.rebase(self.left_motor.angle(), self.right_motor.angle())
+            self._device_snapshot()  # The odometry reads the encoders every tick
+
+    @property
+    def ev3(self):
+        """The EV3Brick, built on first use and shared by every Robot."""
+        global _ev3
+        if _ev3 is None:
+            _ev3 = EV3Brick()
+        return _ev3
+
+    @property
+    def colour_classifier(self):
+        """The colour.ColourClassifier read_colour() and watch_colour() use, built on first use."""
+        if self._colour_classifier is None:
+            from colour import ColourClassifier
+            self._colour_classifier = ColourClassifier()
+        return self._colour_classifier
+
+    @colour_classifier.setter
+    def colour_classifier(self, classifier):
+        self._colour_classifier = classifier
+
+    def mm_to_degrees(self, distance):
+        """
+        Converts a distance in mm to wheel rotation in degrees.
+
+        Parameters:
+        - distance: float, distance in mm
+        """
+        return distance * 360 / (3.14159265 * self.WHEEL_DIAMETER)
+
+    def _encoder_reads(self, shared=False):
+        """
+        Returns the left and right encoder reads for a loop step: through the snapshot when
+        something else in the loop reads the encoders too, as the odometry does or, with
+        `shared`, the step's own until() or stall detectors; straight from the motors otherwise.
+        """
+        if shared or self.odometry:
+            snapshot = self._device_snapshot()
+            snapshot.wanted = True
+            return snapshot.left_angle, snapshot.right_angle
+        return self.left_motor.angle, self.right_motor.angle
+
+    def _device_snapshot(self):
+        """Returns the robot's snapshot.DeviceSnapshot, building it the first time."""
+        if self.snapshot is None:
+            from snapshot import DeviceSnapshot
+            self.snapshot = DeviceSnapshot(self.left_motor, self.right_motor)
+        return self.snapshot
+
+    def _update_pose(self):
+        """Feeds the current encoder readings to the odometry, if the robot tracks its pose."""
+        if self.odometry:
+            self.odometry.update(self.left_motor.angle(), self.right_motor.angle())
+
+    def _reset_encoders(self):
+        """Zeroes both drive encoders without losing the pose."""
+        self._update_pose()
+        self.left_motor.reset_angle(0)
+        self.right_motor.reset_angle(0)
+        if self.snapshot: self.snapshot.invalidate()
+        if self.odometry:
+            self.odometry.rebase(0, 0)
+
+    def _stop_action(self, then):
+        """
+        Returns a function that stops both drive motors as `then` says ("HOLD", "STOP" or "BRAKE").
+        Any other value, such as "CONTINUE", leaves them running.
+        """
+        method = _STOP_METHODS.get(then)
+        if method is None:
+            return lambda: None
+        stop_left = getattr(self.left_motor, method)
+        stop_right = getattr(self.right_motor, method)
+
+        def stop():
+            stop_left()
+            stop_right()
+        return stop
+
+    def start(self, task):
+        """
+        Runs a generator task alongside the drive moves and returns it as a handle for join().
+
+        The task runs up to its first yield straight away, then advances one yield per tick
+        of whichever control loop or join() is running. A task should yield whenever it
+        would otherwise wait.
+
+        Parameters:
+        - task: generator
+        """
+        try:
+            next(task)
+        except StopIteration:
+            return task
+        self._tasks.append(task)
+        return task
+
+    def _run_tasks(self):
+        """Advances every background task by one yield and drops the finished ones."""
+        tasks = self._tasks
+        i = 0
+        while i < len(tasks):
+            try:
+                next(tasks[i])
+                i += 1
+            except StopIteration:
+                tasks.pop(i)
+
+    def _wait_until(self, done, polling_rate=10):
+        """Steps the background tasks every polling_rate ms until done() returns True."""
+        timer = LoopTimer(polling_rate)
+        while not done():
+            self._run_tasks()
+            timer.wait()
+
+    def join(self, task=None):
+        """
+        Waits for a background task started with start(), or for all of them, stepping the
+        tasks meanwhile.
+
+        Parameters:
+        - task: handle returned by start(), or None for every task
+        """
+        tasks = self._tasks
+        if task is None:
+            self._wait_until(lambda: not tasks)
+        else:
+            self._wait_until(lambda: task not in tasks)
+
+    def _control_loop(self, step, polling_rate, then, label):
+        """
+        Shared engine for the closed-loop moves.
+
+        Calls step(elapsed, dt) once per tick, paced by a LoopTimer, until it returns True,
+        then stops the drive motors. `elapsed` is ms since the loop started and `dt` the true
+        duration of the previous tick in whole microseconds. Everything the step needs is
+        resolved by the caller before the loop starts. With then="CONTINUE" the motors keep
+        their last command and their speeds are kept in handoff_speeds for the next move to
+        start from. Background tasks are stepped and the pose updated once per tick.
+        polling_rate may be a control.AdaptiveRate, whose period the loop follows from tick to
+        tick. The rate the loop achieved, in Hz, is left in loop_rate. Every tick starts a new
+        device snapshot, which the odometry reads the encoders through, when the step or the
+        odometry uses it.
+        """
+        stop = self._stop_action(then)
+        profiler = self.profiler
+        if profiler: profiler.start()
+        adaptive = polling_rate if isinstance(polling_rate, AdaptiveRate) else None
+        if adaptive:
+            adaptive.reset()
+            polling_rate = adaptive.max_period
+        timer = LoopTimer(polling_rate)
+        time = self.watch.time
+        odometry = self.odometry
+        snapshot = self.snapshot  # Always there with odometry
+        ticked = snapshot and (odometry or snapshot.wanted)
+        if ticked:
+            next_tick = snapshot.next_tick
+            saved = snapshot.saved
+            read_left = snapshot.left_angle
+            read_right = snapshot.right_angle
+        start = time()
+        dt = timer.period_us
+        tasks = self._tasks
+
+        while True:
+            if profiler: profiler.begin()
+            if ticked: next_tick()
+            if step(time() - start, dt):
+                break
+            if odometry: odometry.update(read_left(), read_right())
+            if tasks: self._run_tasks()
+            if adaptive: timer.set_period_us(adaptive.period_us)
+            timer.wait()
+            dt = timer.dt_us
+
+        stop()
+        if ticked: snapshot.end()
+        duration = time() - start
+        self.loop_rate = 1000 * timer.ticks / duration if duration > 0 else 0
+        if odometry: odometry.update(read_left(), read_right())
+        if then == "CONTINUE":
+            self.handoff_speeds = (self.left_motor.speed(), self.right_motor.speed())
+        else:
+            self.handoff_speeds = (0, 0)
+        self.handoff_speed = (self.handoff_speeds[0] + self.handoff_speeds[1]) / 2
+        if self.debug_mode and timer.overruns: print("{}: {} of {} ticks overran {} ms".format(label, timer.overruns, timer.ticks, polling_rate))
+        if profiler and self.debug_mode: profiler.print_report(label)
+        if adaptive and self.debug_mode: print("{}: {} ticks at {:.0f} Hz".format(label, timer.ticks, self.loop_rate))
+        if ticked and self.debug_mode and timer.ticks:
+            print("{}: {:.1f} device reads saved per tick".format(label, (snapshot.saved - saved) / timer.ticks))
+
+    def _line_step(self, Kp, Kd, mode, TRACE_TARGET, ease_duration, polling_rate, until, ease_offset=0,
+                   estimator=None, Ki=0, feedforward=None, track_map=None):
+        """
+        Builds the line-trace step for _control_loop.
+
+        The estimator (a control.Difference by default) turns each error into an offset and a
+        rate; the turn is Kp times the offset, Kd times the rate, Ki times the summed error,
+        held within a quarter of max speed, plus the feedforward turn in deg/s. until(elapsed,
+        derivative) is asked every tick with the estimated rate and ends the loop by returning
+        True. With a control.AdaptiveRate as polling_rate the step reports its activity to it.
+        Speed ramps up linearly over ease_duration ms, counted from ease_offset ms before the
+        loop starts, from the handoff speed of the previous move, and any difference between
+        the wheels' handoff speeds fades out over the same time. With a TrackMap the step reads
+        the encoders every tick and, while the map is recording, adds its turn to the map; once
+        the map is planned it ramps towards the planned speed instead of the trace speed and
+        adds the map's feedforward turn.
+
+        The tick works in integers only: readings go through the calibration tables when the
+        robot has them, and Kp and Kd are scaled by 256 so the turn is a shift instead of
+        float math, which on the brick allocates a new object for every result.
+        """
+        error_of = _error_function(mode, int(TRACE_TARGET))
+        read_left = self.left_sensor.reflection
+        read_right = self.right_sensor.reflection
+        left_table = self.left_table
+        right_table = self.right_table
+        run_left = self.left_motor.run
+        run_right = self.right_motor.run
+        kp = fixed(Kp)
+        kd = fixed(Kd)
+        ki = fixed(Ki)
+        adaptive = polling_rate if isinstance(polling_rate, AdaptiveRate) else None
+        if adaptive: polling_rate = adaptive.nominal_period
+        period_us = int(polling_rate * 1000)
+        if estimator is None: estimator = Difference()
+        estimator.reset(period_us)
+        estimate = estimator.update
+        integral = 0
+        integral_limit = (int(self.MAX_SPEED) << 8) // (4 * abs(ki)) if ki else 0  # In summed error
+        feedforward_of = feedforward if callable(feedforward) else None
+        bias = 0 if feedforward is None or feedforward_of else int(feedforward)
+        trace_speed = int(self.TRACE_SPEED)
+        max_speed = int(self.MAX_SPEED)
+        entry_speed = int(min(max(self.handoff_speed, 0), trace_speed))
+        # Off an arc the wheels enter at different speeds; that turn is eased out with the speed
+        skew = int(self.handoff_speeds[0] - self.handoff_speeds[1]) // 2 if ease_duration > 0 else 0
+        if track_map:
+            left_angle, right_angle = self._encoder_reads(True)
+            track_map.begin(left_angle() + right_angle())
+            recording = track_map.recording
+            record = track_map.record
+            curvature = track_map.curvature
+            planned = track_map.speeds
+            lead = track_map.lead_bins
+            last_bin = track_map.bins - 1
+            origin = track_map.origin
+            bin_span = 2 * track_map.bin_size
+            if not recording: entry_speed = int(min(max(self.handoff_speed, 0), max_speed))
+        profiler = self.profiler
+        telemetry = self.telemetry
+        data = telemetry.data if telemetry else None
+        start = self.watch.time()
+
+        def step(elapsed, dt):
+            nonlocal integral
+            left_val = read_left()
+            right_val = read_right()
+            if profiler: profiler.sensed()
+            if left_val is None or right_val is None:
+                return until(elapsed, 0)
+            if left_table:
+                left_val = left_table[left_val]
+                right_val = right_table[right_val]
+
+            error = error_of(left_val, right_val)
+            estimate(error, dt)
+            rate = estimator.rate
+            if adaptive: adaptive.note(abs(estimator.offset) + abs(rate))
+            if until(elapsed, rate):
+                return True
+
+            turn = kp * estimator.offset + kd * rate
+            if ki:
+                # Error integrated over time, counted in nominal periods so Ki holds at any rate
+                integral += error * dt // period_us if period_us else error
+                if integral > integral_limit: integral = integral_limit
+                elif integral < -integral_limit: integral = -integral_limit
+                turn += ki * integral
+            turn = (turn >> 8) + bias
+            if feedforward_of: turn += int(feedforward_of(elapsed))
+            top = trace_speed
+            if track_map:
+                index = (left_angle() + right_angle() - origin) // bin_span
+                if index < 0: index = 0
+                elif index > last_bin: index = last_bin
+                if not recording: top = planned[index]
+            eased = elapsed + ease_offset
+            speed = top if eased >= ease_duration else entry_speed + (top - entry_speed) * eased // ease_duration
+            if skew and eased < ease_duration: turn += skew * (ease_duration - eased) // ease_duration
+            if track_map:
+                if recording:
+                    record(index, turn, speed)
+                else:
+                    ahead = index + lead
+                    turn += (curvature[ahead if ahead < last_bin else last_bin] * speed) >> 10
+            speed_left = speed + turn
+            speed_right = speed - turn
+            if speed_left < 0: speed_left = 0
+            elif speed_left > max_speed: speed_left = max_speed
+            if speed_right < 0: speed_right = 0
+            elif speed_right > max_speed: speed_right = max_speed
+            if profiler: profiler.computed()
+
+            run_left(speed_left)
+            run_right(speed_right)
+            if profiler: profiler.commanded()
+            if telemetry:
+                i = telemetry.slot()
+                data[i] = start + elapsed
+                data[i + 1] = left_val
+                data[i + 2] = right_val
+                data[i + 3] = error
+                data[i + 4] = turn
+                data[i + 5] = speed_left
+                data[i + 6] = speed_right
+            return False
+        return step
+
+    def _straight_step(self, speed, ease, correction, until, shared=False):
+        """
+        Builds the straight-driving step for _control_loop.
+
+        Drives both motors at `speed` scaled by ease(elapsed), or at full speed when ease is None,
+        correcting the difference between the encoders when `correction` is set. until(elapsed)
+        is asked at the top of every tick. The encoders are reset when the step is built. With
+        `shared` they are read through the snapshot, for an until() that reads them as well.
+        """
+        k = 0.5  # Correction strength
+        left_motor = self.left_motor
+        right_motor = self.right_motor
+        read_left, read_right = self._encoder_reads(shared)
+        run_left = left_motor.run
+        run_right = right_motor.run
+        profiler = self.profiler
+        telemetry = self.telemetry
+        data = telemetry.data if telemetry else None
+        start = self.watch.time()
+        self._reset_encoders()
+
+        def step(elapsed, dt):
+            if until(elapsed):
+                return True
+            # Correction to keep straight path
+            error = read_right() - read_left() if correction else 0
+            correction_val = k * error
+            if profiler: profiler.sensed()
+
+            if ease is None:
+                speed_left = speed - correction_val
+                speed_right = speed + correction_val
+            else:
+                factor = ease(elapsed)
+                speed_left = (speed - correction_val) * factor
+                speed_right = (speed + correction_val) * factor
+            if profiler: profiler.computed()
+
+            run_left(speed_left)
+            run_right(speed_right)
+            if profiler: profiler.commanded()
+            if telemetry:
+                i = telemetry.slot()
+                data[i] = start + elapsed
+                data[i + 1] = 0
+                data[i + 2] = 0
+                data[i + 3] = error
+                data[i + 4] = int(correction_val)
+                data[i + 5] = int(speed_left)
+                data[i + 6] = int(speed_right)
+            return False
+        return step
+
+    def _cruise_speed(self, speed):
+        """
+        Caps a profile's cruise speed so the drive motors keep headroom to correct position
+        errors. The motors' own speed limit is read once, from their control settings.
+        """
+        if self._motor_speed_limit is None:
+            try:
+                self._motor_speed_limit = min(self.left_motor.control.limits()[0],
+                                              self.right_motor.control.limits()[0])
+            except AttributeError:
+                self._motor_speed_limit = self.MAX_SPEED
+        return min(speed, 0.9 * self._motor_speed_limit)
+
+    def _profiled_move(self, distance, cruise, end_speed, left_scale, right_scale, then, label):
+        """
+        Drives both wheels through a move whose faster wheel travels `distance` degrees at up to
+        `cruise` deg/s and ends at end_speed. The left wheel travels left_scale times the distance
+        and the right wheel right_scale times; negative scales drive backwards. Each wheel starts
+        from the speed the previous move handed it, see _wheel_profiles(). With then="HOLD" the
+        motors' own position control takes out the last few degrees of error once the profiles
+        end; with then="CONTINUE" they are left at their share of end_speed. A robot that tracks
+        its pose instead ends the move on the estimated heading and distance.
+        """
+        if then == "CONTINUE" and (left_scale <= 0 or right_scale <= 0):
+            # The next move would start from rest against wheels still turning
+            raise ValueError("then='CONTINUE' needs both wheels driving forward; {} has to end at rest.".format(label))
+        left, right = self._wheel_profiles(distance, cruise, end_speed, left_scale, right_scale)
+        odometry = self.odometry
+        if odometry and then != "CONTINUE":
+            wheel_mm = distance * odometry.mm_per_degree
+            heading_target = odometry.heading + (left_scale - right_scale) * wheel_mm / odometry.axle_track * 57.2957795
+            distance_target = odometry.distance + (left_scale + right_scale) / 2 * wheel_mm
+            self._control_loop(self._profile_step(left, right), 5, None, label)
+            self._control_loop(self._pose_step(heading_target, distance_target), 5, then, label)
+            return
+
+        left_target = self.left_motor.angle() + left_scale * distance
+        right_target = self.right_motor.angle() + right_scale * distance
+        self._control_loop(self._profile_step(left, right), 5, None if then == "HOLD" else then, label)
+        if then == "HOLD":
+            self.left_motor.run_target(self.BASE_SPEED, left_target, then=Stop.HOLD, wait=False)
+            self.right_motor.run_target(self.BASE_SPEED, right_target, then=Stop.HOLD, wait=not self._tasks)
+            if self._tasks: self._wait_until(self.right_motor.control.done)
+
+    def _wheel_profiles(self, distance, cruise, end_speed, left_scale, right_scale):
+        """
+        Returns (profile, scale) for the left and the right wheel of a move, each wheel's
+        position being scale times its profile's.
+
+        When the wheels enter at speeds in the move's own ratio, as from rest or along a
+        straight, both share one profile of the faster wheel, scaled. Otherwise, as between an
+        arc and a straight, a shared profile would jump the wheel speeds in one tick, so each
+        wheel gets a profile of its own from its own entry speed to its share of end_speed,
+        within the acceleration limit. The one that would finish first has its cruise speed
+        lowered until both take as long, so the wheels stay together and end the move at once.
+        """
+        acceleration, jerk = self.ACCELERATION, self.JERK
+        left_entry, right_entry = self._start_speeds(left_scale, right_scale)
+        left_size, right_size = abs(left_scale), abs(right_scale)
+        lead_entry = min(left_entry if left_size >= right_size else right_entry, cruise)
+        slack = acceleration * 0.005  # What a wheel's speed changes by in a 5 ms tick
+        if abs(left_entry - left_size * lead_entry) <= slack and abs(right_entry - right_size * lead_entry) <= slack:
+            profile = MotionProfile(distance, cruise, acceleration, jerk, lead_entry, end_speed)
+            return (profile, left_scale), (profile, right_scale)
+
+        # Only moves with both wheels forward pick up a handoff, so both scales are positive here
+        wheels = [[left_size * distance, left_size * cruise, left_entry, left_size * end_speed],
+                  [right_size * distance, right_size * cruise, right_entry, right_size * end_speed]]
+        left, right = [MotionProfile(d, c, acceleration, jerk, v0, v1) for d, c, v0, v1 in wheels]
+        quick, wheel = (0, wheels[0]) if left.duration < right.duration else (1, wheels[1])
+        target = max(left.duration, right.duration)
+        low, high = 0, wheel[1]
+        best = None
+        for _ in range(12):
+            mid = (low + high) / 2
+            profile = MotionProfile(wheel[0], mid, acceleration, jerk, wheel[2], wheel[3])
+            if profile.feasible and profile.duration <= target:
+                best = profile
+                high = mid
+            else:
+                low = mid
+        if best is not None:
+            if quick == 0: left = best
+            else: right = best
+        return (left, 1), (right, 1)
+
+    def _pose_step(self, heading_target, distance_target, timeout=400):
+        """
+        Builds a step that drives the estimated heading (degrees) and path length (mm) onto
+        their targets, ending within half a degree and a millimetre or after timeout ms.
+        """
+        k = 10.0  # deg/s per wheel degree of error, as in _profile_step
+        odometry = self.odometry
+        turn_degrees = self.TURN_CONST  # Wheel degrees per degree of heading
+        to_degrees = 1 / odometry.mm_per_degree
+        run_left = self.left_motor.run
+        run_right = self.right_motor.run
+
+        def step(elapsed, dt):
+            heading_error = heading_target - odometry.heading
+            distance_error = distance_target - odometry.distance
+            if (-0.5 < heading_error < 0.5 and -1 < distance_error < 1) or elapsed >= timeout:
+                return True
+            forward = k * distance_error * to_degrees
+            turn = k * heading_error * turn_degrees
+            run_left(forward + turn)
+            run_right(forward - turn)
+            return False
+        return step
+
+    def _profile_step(self, left, right):
+        """
+        Builds a step that makes each wheel follow its (profile, scale) from _wheel_profiles(),
+        with position feedback on the encoders, until both profiles end.
+        """
+        k = 10.0  # Position feedback in deg/s per degree of error
+        read_left, read_right = self._encoder_reads()
+        run_left = self.left_motor.run
+        run_right = self.right_motor.run
+        left_profile, left_scale = left
+        right_profile, right_scale = right
+        sample = left_profile.sample
+        sample_right = None if right_profile is left_profile else right_profile.sample
+        duration = max(left_profile.duration, right_profile.duration) * 1000
+        profiler = self.profiler
+        telemetry = self.telemetry
+        data = telemetry.data if telemetry else None
+        start = self.watch.time()
+        left_start = read_left()
+        right_start = read_right()
+
+        def step(elapsed, dt):
+            position, speed = sample(elapsed / 1000)
+            right_position, right_speed = sample_right(elapsed / 1000) if sample_right else (position, speed)
+            left_error = left_scale * position - (read_left() - left_start)
+            right_error = right_scale * right_position - (read_right() - right_start)
+            if profiler: profiler.sensed()
+            if elapsed >= duration:
+                return True
+
+            speed_left = left_scale * speed + k * left_error
+            speed_right = right_scale * right_speed + k * right_error
+            if profiler: profiler.computed()
+
+            run_left(speed_left)
+            run_right(speed_right)
+            if profiler: profiler.commanded()
+            if telemetry:
+                i = telemetry.slot()
+                data[i] = start + elapsed
+                data[i + 1] = 0
+                data[i + 2] = 0
+                data[i + 3] = int(left_error)
+                data[i + 4] = int(right_error)
+                data[i + 5] = int(speed_left)
+                data[i + 6] = int(speed_right)
+            return False
+        return step
+
+    def set_calibration(self, left_black, left_white, right_black, right_white):
+        """
+        Builds the line sensors' calibration tables from their black and white readings,
+        so both sensors report 0 on black and 100 on white. TRACE_TARGET and the trace
+        gains then mean the same on every robot and mat.
+
+        Parameters:
+        - left_black, left_white: int, left sensor reflection on the line and on the mat
+        - right_black, right_white: int, right sensor reflection on the line and on the mat
+        """
+        self.left_table = _calibration_table(left_black, left_white)
+        self.right_table = _calibration_table(right_black, right_white)
+        self.calibration = (left_black, left_white, right_black, right_white)
+
+    def clear_calibration(self):
+        """Goes back to tracing on the raw sensor readings."""
+        self.left_table = None
+        self.right_table = None
+        self.calibration = None
+
+    def calibrate_sensors(self, sweep=40, speed=300, polling_rate=5, min_contrast=20):
+        """
+        Sweeps both line sensors across the line by turning on the spot, `sweep` degrees
+        each way and back, and calibrates them on the darkest and brightest readings seen.
+        Start with the robot straddling the line.
+
+        Returns (left_black, left_white, right_black, right_white), which can be saved
+        with save_calibration() or passed to set_calibration() on later runs.
+
+        Parameters:
+        - sweep: float, robot degrees to turn each way
+        - speed: int, wheel speed in deg/s during the sweep
+        - polling_rate: sampling period in ms
+        - min_contrast: int, smallest white minus black reading accepted for each sensor
+        """
+        if self.debug_mode: print("Calibrating line sensors over {} degrees each way".format(sweep))
+        read_left = self.left_sensor.reflection
+        read_right = self.right_sensor.reflection
+        left_angle = self._encoder_reads()[0]
+        run_left = self.left_motor.run
+        run_right = self.right_motor.run
+        wheel = sweep * self.TURN_CONST
+        legs = ((wheel, 1), (-wheel, -1), (0, 1))  # Left wheel target and direction
+        origin = left_angle()
+        extremes = [100, 0, 100, 0]  # left black, left white, right black, right white
+        leg = 0
+
+        def step(elapsed, dt):
+            nonlocal leg
+            left_val = read_left()
+            right_val = read_right()
+            if left_val < extremes[0]: extremes[0] = left_val
+            if left_val > extremes[1]: extremes[1] = left_val
+            if right_val < extremes[2]: extremes[2] = right_val
+            if right_val > extremes[3]: extremes[3] = right_val
+            target, direction = legs[leg]
+            if (left_angle() - origin - target) * direction >= 0:
+                leg += 1
+                if leg == len(legs):
+                    return True
+                direction = legs[leg][1]
+            run_left(direction * speed)
+            run_right(-direction * speed)
+            return False
+
+        self._control_loop(step, polling_rate, "HOLD", "calibrate_sensors")
+        left_black, left_white, right_black, right_white = extremes
+        if left_white - left_black < min_contrast or right_white - right_black < min_contrast:
+            raise ValueError("Calibration saw too little contrast: left {}-{}, right {}-{}. "
+                             "Start on the line or widen the sweep.".format(*extremes))
+        self.set_calibration(*extremes)
+        if self.debug_mode: print("Calibrated: left {}-{}, right {}-{}".format(*extremes))
+        return tuple(extremes)
+
+    def save_calibration(self, path="calibration.txt"):
+        """
+        Writes the current calibration readings to a file for load_calibration().
+
+        Parameters:
+        - path: str, file on the brick
+        """
+        if self.calibration is None:
+            raise ValueError("The robot has no calibration to save.")
+        with open(path, "w") as f:
+            f.write(" ".join(str(value) for value in self.calibration) + "\n")
+
+    def load_calibration(self, path="calibration.txt"):
+        """
+        Applies calibration readings saved with save_calibration(). Returns False, keeping
+        the raw readings, when the file does not exist.
+
+        Parameters:
+        - path: str, file on the brick
+        """
+        try:
+            with open(path) as f:
+                values = [int(value) for value in f.read().split()]
+        except OSError:
+            return False
+        self.set_calibration(*values)
+        return True
 
     def line_trace_time(
         self,
@@ -35,7 +994,11 @@ class Robot:
         mode="balance",
         polling_rate : int = 5,
         then="HOLD",
-        TRACE_TARGET=50,):
+        TRACE_TARGET=50,
+        estimator=None,
+        Ki=0,
+        feedforward=None,
+        track_map=None,):
         """
         PD line tracing with multiple modes.
 
@@ -44,59 +1007,25 @@ class Robot:
         - Kp, Kd: PD constants
         - ease_duration: time in ms to gradually increase speed at start
         - mode: string, one of "balance", "left_only", "right_only", "left_minus_right", "right_minus_left"
-        - polling_rate: wait time between updates in ms
-        - then: what to do after duration ends: "HOLD", "STOP", or "BRAKE"
+        - polling_rate: control loop period in ms, or a control.AdaptiveRate
+        - then: what to do after duration ends: "HOLD", "STOP", or "BRAKE", or "CONTINUE" to keep driving into the next move
+        - estimator: optional control.Difference, LowPass or AlphaBeta, reused across calls;
+          defaults to the one-sample difference
+        - Ki: integral gain in deg/s per error summed over nominal periods, 0 for PD
+        - feedforward: turn in deg/s added every tick, or a function (elapsed ms) -> turn
+        - track_map: optional trackmap.TrackMap, recorded on while new and followed once planned
         """
 
         if self.debug_mode: print("Starting line trace for {} ms with mode '{}'".format(duration, mode))
-        last_error = 0
-        start = self.watch.time()  # Start stopwatch
-
-        while (self.watch.time() - start) < duration:
-            left_val = self.left_sensor.reflection()
-            right_val = self.right_sensor.reflection()
-            print(left_val, right_val)  # Debug output
-
-            if left_val is not None and right_val is not None:
-                # Calculate error based on mode
-                if mode == "balance":
-                    error = (TRACE_TARGET - left_val) - (TRACE_TARGET - right_val)
-                elif mode == "left_only":
-                    error = TRACE_TARGET - left_val
-                elif mode == "right_only":
-                    error = TRACE_TARGET - right_val
-                elif mode == "left_minus_right":
-                    error = left_val - right_val
-                elif mode == "right_minus_left":
-                    error = right_val - left_val
-                else:
-                    error = 0  # default no correction
-
-                derivative = error - last_error
-                turn = Kp * error + Kd * derivative
-
-                ease_factor = min(1.0, self.watch.time() / ease_duration) if ease_duration > 0 else 1.0
-
-                speed_left = min(max(self.TRACE_SPEED * ease_factor + turn, 0), self.MAX_SPEED)
-                speed_right = min(max(self.TRACE_SPEED * ease_factor - turn, 0), self.MAX_SPEED)
-
-                self.left_motor.run(speed_left)
-                self.right_motor.run(speed_right)
-
-                last_error = error
-
-            wait(polling_rate)
-
-        # After loop ends
-        if then == "HOLD":
-            self.left_motor.hold()
-            self.right_motor.hold()
-        elif then == "STOP":
-            self.left_motor.stop()
-            self.right_motor.stop()
-        elif then == "BRAKE":
-            self.left_motor.brake()
-            self.right_motor.brake()
+        # From rest line_trace_time has always eased against the robot's stopwatch rather than
+        # the start of the call, and routines are tuned around that, so the offset keeps it that
+        # way. Taking over from a moving robot the ease is timed from the call, so the wheels
+        # start from their handoff speeds.
+        ease_offset = self.watch.time() if self.handoff_speeds == (0, 0) else 0
+        step = self._line_step(Kp, Kd, mode, TRACE_TARGET, ease_duration, polling_rate,
+                               lambda elapsed, derivative: elapsed >= duration, ease_offset,
+                               estimator, Ki, feedforward, track_map)
+        self._control_loop(step, polling_rate, then, "line_trace_time")
 
     def line_trace_junction(
         self,
@@ -107,108 +1036,151 @@ class Robot:
         polling_rate: int = 10,
         then="HOLD",
         TRACE_TARGET=50,
+        debounce=None,
+        stop_after=None,
+        estimator=None,
+        Ki=0,
+        feedforward=None,
+        junction_threshold=20,
+        track_map=None,
     ):
         """
         PD line tracing with multiple modes until a specified number of junctions.
 
+        Junctions are confirmed on the wheel encoders without leaving the control loop, so
+        the robot keeps steering while it crosses them.
+
         Parameters:
         - ease_duration: time in ms to gradually increase speed at start
         - Kp, Kd: PD constants
         - mode: string, one of "balance", "left_only", "right_only", "left_minus_right", "right_minus_left"
-        - polling_rate: wait time between updates in ms
-        - then: what to do after target junctions: "HOLD", "STOP", "BRAKE"
+        - polling_rate: control loop period in ms, or a control.AdaptiveRate
+        - then: what to do after target junctions: "HOLD", "STOP", "BRAKE", or "CONTINUE" to keep driving into the next move
         - junction_count: how many junctions to detect before stopping
+        - debounce: wheel degrees after a junction before another one counts.
+          Defaults to the distance covered in 500 ms at trace speed.
+        - stop_after: mm to keep tracing past the last junction before stopping.
+          Defaults to 100 wheel degrees, the distance the old fixed wait covered at trace speed.
+        - estimator: optional control.Difference, LowPass or AlphaBeta, reused across calls;
+          defaults to the one-sample difference
+        - Ki: integral gain in deg/s per error summed over nominal periods, 0 for PD
+        - feedforward: turn in deg/s added every tick, or a function (elapsed ms) -> turn
+        - track_map: optional trackmap.TrackMap, recorded on while new and followed once planned
+        - junction_threshold: estimated error rate per period that marks a junction. A
+          smoothing estimator reports smaller rates, so lower this with it.
         """
 
         if self.debug_mode:
             print("Starting line trace until {} junction(s) with mode '{}'".format(junction_count, mode))
 
-        last_error = 0
-        junction_threshold = 20
-        last_junction_time = 0
+        if debounce is None: debounce = self.TRACE_SPEED / 2
+        overshoot = 100 if stop_after is None else self.mm_to_degrees(stop_after)
+        left_angle, right_angle = self._encoder_reads(track_map is not None)
+        last_junction = None
         junctions_detected = 0
-        start_time = self.watch.time()
-        last_update = start_time
-
-        while True:
-            left_val = self.left_sensor.reflection()
-            right_val = self.right_sensor.reflection()
-
-            if left_val is not None and right_val is not None:
-                # Calculate error based on mode
-                if mode == "balance":
-                    error = (TRACE_TARGET - left_val) - (TRACE_TARGET - right_val)
-                elif mode == "left_only":
-                    error = TRACE_TARGET - left_val
-                elif mode == "right_only":
-                    error = TRACE_TARGET - right_val
-                elif mode == "left_minus_right":
-                    error = left_val - right_val
-                elif mode == "right_minus_left":
-                    error = right_val - left_val
-                else:
-                    error = 0
-
-                derivative = error - last_error
-                turn = Kp * error + Kd * derivative
-
-                elapsed = self.watch.time() - start_time
-                ease_factor = min(1.0, elapsed / ease_duration) if ease_duration > 0 else 1.0
-
-                # Only check junctions after easing
-                if ease_factor >= 1.0:
-                    detect_junction = abs(derivative) > junction_threshold
-                    junction_cooldown = self.watch.time() - last_junction_time > 500
-
-                    if detect_junction and (last_junction_time == 0 or junction_cooldown):
-                        junctions_detected += 1
-                        last_junction_time = self.watch.time()
-                        if junctions_detected >= junction_count:
-                            wait(100000/self.TRACE_SPEED)
-                            break
-                        wait(100000/self.TRACE_SPEED)  # Wait to avoid multiple detections
-                
-                if self.debug_mode: 
-                    if self.debug_mode == 2: print("Left: {}, Right: {}, Error: {}, Derivative: {} Delta_time: {}".format(left_val, right_val, error, derivative, self.watch.time() - last_update))
-                    last_update = self.watch.time()
+        stop_at = None
+        adaptive = polling_rate if isinstance(polling_rate, AdaptiveRate) else None
+        hurry_threshold = junction_threshold // 2
+        mapping = track_map is not None and track_map.recording
+
+        def until(elapsed, derivative):
+            nonlocal last_junction, junctions_detected, stop_at
+            if stop_at is not None:
+                if adaptive: adaptive.hurry()
+                return left_angle() + right_angle() >= stop_at
+            # Sample fast while the rate climbs towards a junction, to catch its peak
+            if adaptive and abs(derivative) > hurry_threshold: adaptive.hurry()
+            # Only check junctions after easing
+            if elapsed < ease_duration or abs(derivative) <= junction_threshold:
+                return False
+            position = left_angle() + right_angle()  # Twice the distance in wheel degrees
+            if last_junction is not None and position - last_junction < 2 * debounce:
+                return False
+            junctions_detected += 1
+            last_junction = position
+            if mapping: track_map.mark_junction(position)
+            if self.debug_mode: print("Junction {} at {} ms".format(junctions_detected, elapsed))
+            if junctions_detected < junction_count:
+                return False
+            stop_at = position + 2 * overshoot
+            return overshoot <= 0
+
+        step = self._line_step(Kp, Kd, mode, TRACE_TARGET, ease_duration, polling_rate, until,
+                               estimator=estimator, Ki=Ki, feedforward=feedforward, track_map=track_map)
+        self._control_loop(step, polling_rate, then, "line_trace_junction")
+
+    def line_trace_rotations(
+        self,
+        rotations: float,
+        Kp, Kd,
+        mode="balance",
+        ease_duration: int = 400,
+        polling_rate: int = 10,
+        then="HOLD",
+        TRACE_TARGET=50,
+        estimator=None,
+        Ki=0,
+        feedforward=None,
+        track_map=None,
+    ):
+        """
+        PD line tracing with multiple modes for a distance measured by the wheel encoders.
 
-                speed_left = min(max(self.TRACE_SPEED * ease_factor + turn, 0), self.MAX_SPEED)
-                speed_right = min(max(self.TRACE_SPEED * ease_factor - turn, 0), self.MAX_SPEED)
+        Parameters:
+        - rotations: float, average wheel rotations to travel before stopping
+        - Kp, Kd: PD constants
+        - mode: string, one of "balance", "left_only", "right_only", "left_minus_right", "right_minus_left"
+        - ease_duration: time in ms to gradually increase speed at start
+        - polling_rate: control loop period in ms, or a control.AdaptiveRate
+        - then: what to do after the distance: "HOLD", "STOP", "BRAKE", or "CONTINUE" to keep driving into the next move
+        - estimator: optional control.Difference, LowPass or AlphaBeta, reused across calls;
+          defaults to the one-sample difference
+        - Ki: integral gain in deg/s per error summed over nominal periods, 0 for PD
+        - feedforward: turn in deg/s added every tick, or a function (elapsed ms) -> turn
+        - track_map: optional trackmap.TrackMap, recorded on while new and followed once planned
+        """
+        if self.debug_mode: print("Starting line trace for {} rotations with mode '{}'".format(rotations, mode))
 
-                self.left_motor.run(speed_left)
-                self.right_motor.run(speed_right)
+        left_angle, right_angle = self._encoder_reads(track_map is not None)
+        target = 2 * 360 * rotations  # Sum of both encoders
+        self._reset_encoders()
+        adaptive = polling_rate if isinstance(polling_rate, AdaptiveRate) else None
+        near = target - 2 * 90  # Sample fast over the last 90 wheel degrees to stop on time
 
-                last_error = error
+        def until(elapsed, derivative):
+            position = left_angle() + right_angle()
+            if adaptive and position >= near: adaptive.hurry()
+            return position >= target
 
-            wait(polling_rate)
+        step = self._line_step(Kp, Kd, mode, TRACE_TARGET, ease_duration, polling_rate, until,
+                               estimator=estimator, Ki=Ki, feedforward=feedforward, track_map=track_map)
+        self._control_loop(step, polling_rate, then, "line_trace_rotations")
 
-        # After loop ends
-        if then == "HOLD":
-            self.left_motor.hold()
-            self.right_motor.hold()
-        elif then == "STOP":
-            self.left_motor.stop()
-            self.right_motor.stop()
-        elif then == "BRAKE":
-            self.left_motor.brake()
-            self.right_motor.brake()
+    def _start_speeds(self, left_scale, right_scale):
+        """
+        Wheel speeds a profile for these wheel scales can start at, given the previous move's
+        handoff. Only moves that drive both wheels forward, like the handoff, pick it up;
+        anything else starts from rest.
+        """
+        left, right = self.handoff_speeds
+        if left_scale > 0 and right_scale > 0 and left > 0 and right > 0:
+            return left, right
+        return 0, 0
 
-    def turn_arc(self, angle: float, radius_factor=0.0, then="HOLD"):
+    def turn_arc(self, angle: float, radius_factor=0.0, then="HOLD", exit_speed=None):
         """
         Turns the robot along an arc using differential wheel speeds.
 
         Parameters:
         - angle: float, turn amount in degrees. Positive for right, negative for left.
         - radius_factor: float, adjusts arc radius (0 = in-place turn, higher = wider arc).
-        - then: action after turn ends. One of "HOLD", "STOP", or "BRAKE".
+        - then: action after turn ends. One of "HOLD", "STOP", or "BRAKE", or "CONTINUE" to
+          hand over to the next move at speed. "CONTINUE" needs the robot's acceleration limit
+          and an arc that drives both wheels forward; in-place turns end at rest.
+        - exit_speed: float, speed of the outer wheel in deg/s at the end of the turn with
+          then="CONTINUE", the inner wheel leaving at its share of it. Defaults to the cruise speed.
         """
         if self.debug_mode: print("Turning arc with angle {} and radius factor {}".format(angle, radius_factor))
-        if then == "HOLD":
-            then = Stop.HOLD
-        elif then == "STOP":
-            then = Stop.COAST
-        elif then == "BRAKE":
-            then = Stop.BRAKE
 
         left_angle = angle * self.TURN_CONST + radius_factor
         right_angle = -angle * self.TURN_CONST + radius_factor
@@ -216,6 +1188,21 @@ class Robot:
         abs_left = abs(left_angle)
         abs_right = abs(right_angle)
 
+        if self.ACCELERATION:
+            # Profile the wheel with further to go; the other follows in proportion
+            lead = max(abs_left, abs_right)
+            if lead == 0: return
+            cruise = self._cruise_speed(self.MAX_SPEED)
+            end_speed = (cruise if exit_speed is None else min(exit_speed, cruise)) if then == "CONTINUE" else 0
+            self._profiled_move(lead, cruise, end_speed, left_angle / lead, right_angle / lead, then, "turn_arc")
+            return
+        if then == "CONTINUE":
+            raise ValueError("then='CONTINUE' needs the robot's acceleration limit.")
+        self.handoff_speed = 0
+        self.handoff_speeds = (0, 0)
+
+        then = _STOP_MODES.get(then, then)
+
         if abs_left > abs_right:
             ratio = abs_left / abs_right
             speed_left = self.BASE_SPEED
@@ -226,28 +1213,60 @@ class Robot:
             speed_left = self.BASE_SPEED / ratio
 
         self.left_motor.run_angle(speed_left if left_angle >= 0 else -speed_left, abs_left, wait=False, then=then)
-        self.right_motor.run_angle(speed_right if right_angle >= 0 else -speed_right, abs_right, then=then)
+        self.right_motor.run_angle(speed_right if right_angle >= 0 else -speed_right, abs_right, then=then, wait=not self._tasks)
+        if self._tasks: self._wait_until(self.right_motor.control.done)
+        self._update_pose()
     
-    def move_rotations(self, rotations: float, then="HOLD", speed = None):
+    def turn_to(self, heading: float, radius_factor=0.0, then="HOLD"):
+        """
+        Turns to a heading of the pose estimate, so errors left by earlier moves are taken
+        out rather than added to. Needs the robot's axle track.
+
+        Parameters:
+        - heading: float, degrees, positive clockwise from the heading when tracking started.
+        - radius_factor: float, adjusts arc radius (0 = in-place turn, higher = wider arc).
+        - then: action after turn ends. One of "HOLD", "STOP", or "BRAKE".
+        """
+        if not self.odometry:
+            raise ValueError("turn_to needs the robot's axle_track to track its heading.")
+        self._update_pose()
+        angle = (heading - self.odometry.heading + 180) % 360 - 180
+        self.turn_arc(angle, radius_factor, then)
+
+    def move_rotations(self, rotations: float, then="HOLD", speed = None, exit_speed=None):
         """
         Moves the robot forward for a given number of wheel rotations.
 
         Parameters:
         - rotations: float, number of full rotations to move (positive = forward, negative = backward).
-        - then: action after movement ends. One of "HOLD", "STOP", or "BRAKE".
-        - speed: int, optional speed in degrees per second. Defaults to base speed.
+        - then: action after movement ends. One of "HOLD", "STOP", or "BRAKE", or "CONTINUE" to
+          hand over to the next move at speed. "CONTINUE" needs the robot's acceleration limit
+          and a forward move; reversing ends at rest.
+        - speed: int, optional speed in degrees per second. Defaults to base speed,
+          or to max speed when the robot has an acceleration limit.
+        - exit_speed: float, wheel speed in deg/s at the end of the move with then="CONTINUE".
+          Defaults to the cruise speed.
         """
         if self.debug_mode: print("Moving {} rotations with action '{}'".format(rotations, then))
 
-        if then == "HOLD":
-            then = Stop.HOLD
-        elif then == "STOP":
-            then = Stop.COAST
-        elif then == "BRAKE":
-            then = Stop.BRAKE
+        if self.ACCELERATION:
+            # Profiled moves cruise at up to MAX_SPEED unless a speed is given
+            direction = -1 if ((speed or 1) < 0) != (rotations < 0) else 1
+            cruise = self._cruise_speed(abs(speed) if speed else self.MAX_SPEED)
+            end_speed = (cruise if exit_speed is None else min(exit_speed, cruise)) if then == "CONTINUE" else 0
+            self._profiled_move(abs(rotations) * 360, cruise, end_speed, direction, direction, then, "move_rotations")
+            return
+        if then == "CONTINUE":
+            raise ValueError("then='CONTINUE' needs the robot's acceleration limit.")
+        self.handoff_speed = 0
+        self.handoff_speeds = (0, 0)
+
+        then = _STOP_MODES.get(then, then)
         if not speed: speed = self.BASE_SPEED
         self.left_motor.run_angle(speed, rotations * 360, wait=False, then=then)
-        self.right_motor.run_angle(speed, rotations * 360, then=then)
+        self.right_motor.run_angle(speed, rotations * 360, then=then, wait=not self._tasks)
+        if self._tasks: self._wait_until(self.right_motor.control.done)
+        self._update_pose()
 
     def move_time(self, duration: float, reverse: bool = False, ease_in: bool = False, ease_out: bool = False, polling_rate: int = 10, then: str = "HOLD", correction: bool = True):
         """
@@ -258,12 +1277,11 @@ class Robot:
         - reverse: bool, move backward if True.
         - ease_in: bool, gradually increase speed at start.
         - ease_out: bool, gradually decrease speed at end.
-        - polling_rate: int, time in ms between control updates.
+        - polling_rate: int, control loop period in ms.
         - then: str, one of "HOLD", "STOP", or "BRAKE" after movement ends.
         - correction: bool, enable motor angle correction to keep a straight path.
         """
         if self.debug_mode: print("Moving for {} ms, reverse={}, ease_in={}, ease_out={}, correction={}, then='{}'".format(duration, reverse, ease_in, ease_out, correction, then))
-        k = 0.5  # Correction strength
 
         # Determine easing duration
         if ease_in and ease_out:
@@ -273,191 +1291,276 @@ class Robot:
         else:
             ease_duration = 0
 
-        ease_factor = 0 if ease_in else 1
-
-        start = self.watch.time()
-        delta_time = self.watch.time() - start
-
-        self.left_motor.reset_angle(0)
-        self.right_motor.reset_angle(0)
-
-        while delta_time < duration:
-            # Adjust easing factor
-            if ease_in and delta_time < ease_duration:
-                ease_factor = min(1, delta_time / ease_duration)
-            elif ease_out and duration - delta_time < ease_duration:
-                ease_factor = max(0, (duration - delta_time) / ease_duration)
-
-            # Apply correction if enabled
-            if correction:
-                error = self.right_motor.angle() - self.left_motor.angle()
-                correction_val = k * error
-            else:
-                correction_val = 0
-
-            speed_left = (self.BASE_SPEED - correction_val) * ease_factor
-            speed_right = (self.BASE_SPEED + correction_val) * ease_factor
-
-            if reverse:
-                self.left_motor.run(-speed_left)
-                self.right_motor.run(-speed_right)
-            else:
-                self.left_motor.run(speed_left)
-                self.right_motor.run(speed_right)
-
-            wait(polling_rate)
-            delta_time = self.watch.time() - start
-
-        # Stop behavior
-        if then == "HOLD":
-            self.left_motor.hold()
-            self.right_motor.hold()
-        elif then == "STOP":
-            self.left_motor.stop()
-            self.right_motor.stop()
-        elif then == "BRAKE":
-            self.left_motor.brake()
-            self.right_motor.brake()
+        def ease(elapsed):
+            if ease_in and elapsed < ease_duration:
+                return elapsed / ease_duration
+            if ease_out and duration - elapsed < ease_duration:
+                return max(0, (duration - elapsed) / ease_duration)
+            return 1
+
+        if self.ACCELERATION and ease_duration:
+            # Ramp at the robot's acceleration limit instead of over a fixed 400 ms
+            ramp_up = Ramp(0, self.BASE_SPEED, self.ACCELERATION, self.JERK)
+            ramp_down = Ramp(self.BASE_SPEED, 0, self.ACCELERATION, self.JERK)
+
+            def ease(elapsed):
+                t = elapsed / 1000
+                factor = 1
+                if ease_in and t < ramp_up.duration:
+                    factor = ramp_up.sample(t)[1] / self.BASE_SPEED
+                remaining = duration / 1000 - t
+                if ease_out and remaining < ramp_down.duration:
+                    factor = min(factor, ramp_down.sample(ramp_down.duration - remaining)[1] / self.BASE_SPEED)
+                return factor
+
+        step = self._straight_step(-self.BASE_SPEED if reverse else self.BASE_SPEED,
+                                   ease if ease_duration else None, correction,
+                                   lambda elapsed: elapsed >= duration)
+        self._control_loop(step, polling_rate, then, "move_time")
     
-    def bump_align(self, debounce_duration: int = 100, ease_in: bool = False, polling_rate: int = 10, correction: bool = True, then: str = "HOLD"):
+    def bump_align(self, debounce_duration: int = 30, ease_in: bool = False, polling_rate: int = 10, correction: bool = True, then: str = "HOLD"):
         """
         Moves robot forward until it hits a wall (motor stalls).
         Applies easing and motor angle correction while moving.
-        Uses debounce_duration to confirm wall hit.
+        Each wheel has a StallDetector, and the wall counts once both have stalled, so the
+        robot ends squared up against it.
         
         Parameters:
-        - debounce_duration: int, ms to confirm stall before stopping
+        - debounce_duration: int, ms a stall must last on both wheels before stopping
         - ease_in: bool, gradually increase speed at start
-        - polling_rate: int, ms between control updates
+        - polling_rate: int, control loop period in ms
         - correction: bool, motor angle correction to keep straight
         - then: str, one of "HOLD", "STOP", or "BRAKE" after movement ends
         """
         if self.debug_mode: print("Bump align with debounce_duration={}, ease_in={}, correction={}, then='{}'".format(debounce_duration, ease_in, correction, then))
 
-        k = 0.5  # correction strength
-        ease_duration = 400 if ease_in else 0
-        stall_threshold = 100
+        ease_duration = 400
+        speed = self.BASE_SPEED
+        # Stopped is under 100 deg/s, as before, or under a third of the commanded speed
+        snapshot = self._device_snapshot()
+        left_detector = StallDetector(snapshot.left, debounce_duration, min_speed=100)
+        right_detector = StallDetector(snapshot.right, debounce_duration, min_speed=100)
 
-        start = self.watch.time()
-        last_movement_time = start
-        speed_factor = 0 if ease_in else 1
+        ease = (lambda elapsed: elapsed / ease_duration if elapsed < ease_duration else 1) if ease_in else None
 
-        self.left_motor.reset_angle(0)
-        self.right_motor.reset_angle(0)
+        def stalled(elapsed):
+            commanded = speed * ease(elapsed) if ease else speed
+            left = left_detector.update(elapsed, commanded)
+            return right_detector.update(elapsed, commanded) and left
+        step = self._straight_step(-speed, ease, correction, stalled, shared=True)
+        self._control_loop(step, polling_rate, then, "bump_align")
 
+    def _aux_motor(self, motor_number):
+        """Returns auxiliary motor 1 or 2, built if it was Lazy, raising ValueError if it is missing."""
+        if motor_number == 1:
+            if not self.aux_motor_1:
+                raise ValueError("Auxiliary motor 1 is not initialized.")
+            self.aux_motor_1 = _built(self.aux_motor_1)
+            return self.aux_motor_1
+        elif motor_number == 2:
+            if not self.aux_motor_2:
+                raise ValueError("Auxiliary motor 2 is not initialized.")
+            self.aux_motor_2 = _built(self.aux_motor_2)
+            return self.aux_motor_2
+        raise ValueError("Invalid motor number. Use 1 or 2.")
+
+    def _aux_angle_task(self, aux_motor, angle):
+        aux_motor.run_angle(self.AUX_SPEED, angle, then=Stop.HOLD, wait=False)
+        done = aux_motor.control.done
+        while not done():
+            yield
+
+    def _aux_stall_task(self, aux_motor, reversed, waiting, stall_threshold, polling_rate, confirm_time):
+        time = self.watch.time
+        start = time()
+        speed = -self.AUX_SPEED if reversed else self.AUX_SPEED
+        # stall_threshold is in degrees per 100 ms, the period it used to be checked over
+        detector = StallDetector(aux_motor, confirm_time, min_speed=10 * stall_threshold)
+        detector.reset(start)
+        aux_motor.run(speed)
+
+        check_at = start
         while True:
-            now = self.watch.time()
-            delta_time = now - start
-
-            # Ease-in speed factor
-            if ease_in and delta_time < ease_duration:
-                speed_factor = min(1, delta_time / ease_duration)
-            else:
-                speed_factor = 1
-
-            # Correction to keep straight path
-            if correction:
-                error = self.right_motor.angle() - self.left_motor.angle()
-                correction_val = k * error
-            else:
-                correction_val = 0
-
-            speed_left = -(self.BASE_SPEED - correction_val) * speed_factor
-            speed_right = -(self.BASE_SPEED + correction_val) * speed_factor
-
-            self.left_motor.run(speed_left)
-            self.right_motor.run(speed_right)
-
-            # Detect stall by checking if motors have moved significantly
-            print(self.left_motor.speed())
-            left_moved = abs(self.left_motor.speed()) > stall_threshold
-            right_moved = abs(self.right_motor.speed()) > stall_threshold
-
-            if left_moved or right_moved:
-                last_movement_time = now
-
-            # If no movement detected for debounce_duration, assume hit wall
-            if now - last_movement_time > debounce_duration:
+            check_at += polling_rate
+            while time() < check_at:
+                yield
+            if detector.update(time(), speed):
                 break
 
-            wait(polling_rate)
-
-        # Stop motors based on 'then' parameter
-        if then == "HOLD":
-            self.left_motor.hold()
-            self.right_motor.hold()
-        elif then == "STOP":
-            self.left_motor.stop()
-            self.right_motor.stop()
-        elif then == "BRAKE":
-            self.left_motor.brake()
-            self.right_motor.brake()
+        if waiting: aux_motor.stop()
 
-    def move_aux_angle(self, angle, motor_number : int, waiting = True):
+    def move_aux_angle(self, angle, motor_number : int, waiting = True, background = False):
         """
         Moves the auxiliary motor to a specific angle.
 
         Parameters:
         - angle: float, target angle in degrees.
         - motor_number: int, 1 or 2 to select auxiliary motor.
+        - waiting: bool, wait for the move to finish.
+        - background: bool, return straight away with a task handle for join() instead,
+          so the move overlaps with the drive moves that follow.
         """
         if self.debug_mode: print("Moving auxiliary motor {} to angle {}".format(motor_number, angle))
-        if motor_number == 1:
-            if not self.aux_motor_1:
-                raise ValueError("Auxiliary motor 1 is not initialized.")
-            aux_motor = self.aux_motor_1
-        elif motor_number == 2:
-            if not self.aux_motor_2:
-                raise ValueError("Auxiliary motor 2 is not initialized.")
-            aux_motor = self.aux_motor_2
-        else:
-            raise ValueError("Invalid motor number. Use 1 or 2.")
-        
-        aux_motor.run_angle(self.AUX_SPEED, angle, then=Stop.HOLD, wait = waiting)
-    
-    def move_aux_stall(self, motor_number : int, reversed = False, waiting = True, stall_threshold=5, polling_rate=100):
+        task = self.start(self._aux_angle_task(self._aux_motor(motor_number), angle))
+        if background: return task
+        if waiting: self.join(task)
+
+    def move_aux_stall(self, motor_number : int, reversed = False, waiting = True, stall_threshold=5, polling_rate=10, background = False, confirm_time=50):
         """
-        Moves the auxiliary motor until it stalls.
+        Moves the auxiliary motor until it stalls, as decided by a StallDetector.
 
         Parameters:
         - motor_number: int, 1 or 2 to select auxiliary motor.
-        - stall_threshold: int, angle threshold to detect stall.
-        - polling_rate: int, ms between control updates.
+        - waiting: bool, stop the motor once it stalls.
+        - stall_threshold: int, degrees per 100 ms under which the motor always counts as stopped.
+        - polling_rate: int, stall check period in ms.
+        - confirm_time: int, ms a stall must last.
+        - background: bool, return straight away with a task handle for join() instead,
+          so the move overlaps with the drive moves that follow.
         """
-        start = self.watch.time()
         if self.debug_mode: print("Moving auxiliary motor {} until stall with threshold {}".format(motor_number, stall_threshold))
-        if motor_number == 1:
-            if not self.aux_motor_1:
-                raise ValueError("Auxiliary motor 1 is not initialized.")
-            aux_motor = self.aux_motor_1
-        elif motor_number == 2:
-            if not self.aux_motor_2:
-                raise ValueError("Auxiliary motor 2 is not initialized.")
-            aux_motor = self.aux_motor_2
-        else:
-            raise ValueError("Invalid motor number. Use 1 or 2.")
-        
-        prev_angle = aux_motor.angle()
-        aux_motor.run(-self.AUX_SPEED if reversed else self.AUX_SPEED)
+        task = self.start(self._aux_stall_task(self._aux_motor(motor_number), reversed, waiting,
+                                               stall_threshold, polling_rate, confirm_time))
+        if background: return task
+        self.join(task)
 
-        print(abs(aux_motor.angle() - prev_angle))
+    def get_colour(self, sensor_num):
+        """
+        Returns the color detected by the specified auxiliary sensor, from a single
+        ColorSensor.color() reading. read_colour() is more reliable.
+        Parameters:
+        - sensor_num: int, 1 or 2 to select auxiliary sensor.
+        """
+        return self._aux_sensor(sensor_num).color()
+
+    def _aux_sensor(self, sensor_num):
+        """Returns auxiliary sensor 1 or 2, built if it was Lazy, raising ValueError if it is missing."""
+        if sensor_num == 1:
+            if not self.aux_sensor_1:
+                raise ValueError("Auxiliary sensor 1 is not initialized.")
+            self.aux_sensor_1 = _built(self.aux_sensor_1)
+            return self.aux_sensor_1
+        elif sensor_num == 2:
+            if not self.aux_sensor_2:
+                raise ValueError("Auxiliary sensor 2 is not initialized.")
+            self.aux_sensor_2 = _built(self.aux_sensor_2)
+            return self.aux_sensor_2
+        raise ValueError("Invalid sensor number. Use 1 or 2.")
+
+    def read_colour(self, sensor_num, samples=5):
+        """
+        Classifies a quick burst of rgb() readings from an auxiliary sensor through
+        colour_classifier and returns (colour, confidence), confidence being the share of
+        the readings taken that agreed. Stops early once no other colour can overtake the
+        leader, so it takes at most `samples` reads. Returns (None, 0) when nothing matched a
+        known colour.
 
-        while abs(aux_motor.angle() - prev_angle) > stall_threshold or (self.watch.time() - start) < 500:
-            prev_angle = aux_motor.angle()
-            wait(polling_rate)
+        Parameters:
+        - sensor_num: int, 1 or 2 to select auxiliary sensor.
+        - samples: int, most readings to take
 
+        Without prepare_colour() beforehand, the first read after the colours change also
+        builds the classifier's lookup table.
+        """
+        colour, confidence = self.colour_classifier.classify(self._aux_sensor(sensor_num).rgb, samples)
+        if self.debug_mode: print("Colour {} with confidence {:.2f}".format(colour, confidence))
+        return colour, confidence
 
-        if waiting: aux_motor.stop()
+    def prepare_colour(self):
+        """
+        Builds colour_classifier's lookup table now, so read_colour() and watch_colour() do not
+        pay for it while driving. Call it before the mission, after the last calibrate_colour();
+        the build takes far longer on the brick than one reading.
+        """
+        self.colour_classifier.prepare()
 
-    def get_colour(self, sensor_num):
+    def calibrate_colour(self, sensor_num, colour, samples=20, prepare=True):
+        """
+        Averages `samples` rgb() readings of an object held under an auxiliary sensor and
+        stores them as that colour's reading in colour_classifier. Returns the (r, g, b) stored.
+
+        Parameters:
+        - sensor_num: int, 1 or 2 to select auxiliary sensor.
+        - colour: Color the object is
+        - samples: int, readings to average
+        - prepare: bool, rebuild the lookup table straight away, see prepare_colour(). When
+          calibrating several colours in a row, pass False to all but the last.
+        """
+        read_rgb = self._aux_sensor(sensor_num).rgb
+        total = [0, 0, 0]
+        for _ in range(samples):
+            r, g, b = read_rgb()
+            total[0] += r
+            total[1] += g
+            total[2] += b
+        rgb = tuple((value + samples // 2) // samples for value in total)
+        self.colour_classifier.calibrate(colour, rgb)
+        if prepare: self.colour_classifier.prepare()
+        if self.debug_mode: print("Calibrated {} as {}".format(colour, rgb))
+        return rgb
+
+    def _colour_task(self, sensor, watch, polling_rate):
+        classifier = self.colour_classifier
+        index = classifier.index
+        names = classifier.names
+        read_rgb = sensor.rgb
+        time = self.watch.time
+        samples = watch.samples
+        nothing = len(names)  # Vote slot for readings that match no colour
+        recent = bytearray(samples)
+        counts = [0] * (nothing + 1)
+        filled = 0
+        position = 0
+        next_at = time()
+        while watch.running:
+            now = time()
+            if now < next_at:
+                yield
+                continue
+            next_at = now + polling_rate
+            i = index(read_rgb())
+            if i == 255: i = nothing
+            if filled < samples:
+                filled += 1
+            else:
+                counts[recent[position]] -= 1
+            counts[i] += 1
+            recent[position] = i
+            position = position + 1 if position + 1 < samples else 0
+            best = 0
+            for j in range(1, nothing + 1):
+                if counts[j] > counts[best]: best = j
+            colour = names[best] if best != nothing else None
+            confidence = counts[best] / filled
+            watch.colour = colour
+            watch.confidence = confidence
+            history = watch.history
+            if confidence >= watch.min_confidence and (not history or history[-1][1] != colour):
+                history.append((now, colour))
+                if self.debug_mode: print("Colour {} at {} ms".format(colour, now))
+            yield
+
+    def watch_colour(self, sensor_num, samples=5, min_confidence=0.6, polling_rate=0):
         """
-        Returns the color detected by the specified auxiliary sensor.
+        Starts classifying an auxiliary sensor's readings in the background, one reading per
+        step of the running control loop, so objects can be identified while driving past them.
+        Returns a colour.ColourWatch with the current colour and the history of colours seen. Stop
+        it with its stop() before a join() that waits for every task.
+
         Parameters:
         - sensor_num: int, 1 or 2 to select auxiliary sensor.
+        - samples: int, readings the majority is taken over
+        - min_confidence: float, 0-1, share of those readings a colour needs to enter the history
+        - polling_rate: int, ms between readings, 0 for every step
+
+        The classifier's lookup table is built here if it is not yet, before the task starts,
+        rather than in the control loop the task runs in; prepare_colour() does it earlier.
         """
-        if sensor_num == 1: return self.aux_sensor_1.color()
-        elif sensor_num == 2: return self.aux_sensor_2.color()
-        else: raise("invalid Sensor_num")
+        from colour import ColourWatch
+        self.colour_classifier.prepare()
+        watch = ColourWatch(samples, min_confidence)
+        watch.task = self.start(self._colour_task(self._aux_sensor(sensor_num), watch, polling_rate))
+        return watch
 
         
 
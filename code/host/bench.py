@@ -0,0 +1,412 @@
+"""
+Benchmarks the Robot methods and fails when a change makes them slower.
+
+    python code/host/bench.py            # run and compare with bench_baseline.json
+    python code/host/bench.py --save     # run and store the results as the new baseline
+
+Every method is measured twice:
+
+- CPU: against stub devices that return canned readings and only move the virtual clock,
+  looping free where the method takes a polling rate. This gives control iterations per
+  CPU second, CPU microseconds per tick and memory blocks still allocated per tick after
+  the call (a leak or a per-tick list append shows here; CPython's short-lived floats do
+  not). Each run is paired with a reference loop, a plain proportional controller over the
+  same stubs, and the cost per tick is also given as a multiple of it (cpu x), which holds
+  still when the whole machine runs faster or slower.
+- Simulated: on the `evsim` mat with device latency, at the method's usual polling rate.
+  This gives the achieved loop period (mean and p99), how long the move takes, the device
+  calls it makes (per tick, or in total for methods without a control loop) and how many
+  device reads per tick the robot's DeviceSnapshot saved.
+
+The reference routine is `main.py` run in the simulator; its mission time is the last line.
+Its startup, the simulated time from launch to the first motor command, is gated like the
+other simulated times. Device construction is charged in the simulator, so lazy devices
+show up there. Next to it is the host time to compile the library modules main.py imports
+at launch, which the brick spends on every launch unless it runs the .mpy build from
+build_mpy.py; modules imported inside functions are left out. It is only reported.
+Startup and mission times come from the simulator's device costs (evsim.Layout.io_cost_us),
+which are estimates, not timings taken on a brick.
+
+The gate is on the deterministic figures: simulated times, periods and device calls are
+compared tightly. Absolute CPU microseconds swing by half between runs on a shared host, so
+they are only reported; the reference-relative cpu x is gated with a wide tolerance. It
+divides the fastest of --repeat short slices of the method by the fastest of as many slices
+of the reference loop, taken in turn with them. Refresh the baseline with --save after a deliberate change.
+"""
+
+import argparse
+import ast
+import gc
+import io
+import json
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+import simulate
+import evsim
+
+BASELINE = os.path.join(simulate.HOST_DIR, "bench_baseline.json")
+
+
+class _StubMotor:
+    """Integrates the commanded speed over the virtual clock, stopping at an optional travel limit."""
+
+    def __init__(self, world, limit=None):
+        self._world = world
+        self._limit = limit
+        self._angle = 0.0
+        self._speed = 0.0
+        self._last = world.now_us
+        self.runs = 0
+        self.reads = 0
+
+    def _update(self):
+        now = self._world.now_us
+        angle = self._angle + self._speed * (now - self._last) / 1e6
+        self._last = now
+        if self._limit is not None and abs(angle) > self._limit:
+            angle = self._limit if angle > 0 else -self._limit
+            self._speed = 0.0
+        self._angle = angle
+
+    def run(self, speed):
+        self._update()
+        self._speed = speed
+        self.runs += 1
+        self._world.now_us += 100
+
+    def angle(self):
+        self._update()
+        self.reads += 1
+        self._world.now_us += 100
+        return int(self._angle)
+
+    def speed(self):
+        self._update()
+        self._world.now_us += 100
+        return int(self._speed)
+
+    def reset_angle(self, angle=0):
+        self._update()
+        self._angle = float(angle)
+
+    def hold(self):
+        self._update()
+        self._speed = 0.0
+
+    stop = brake = hold
+
+    def run_angle(self, speed, rotation_angle, then=None, wait=True):
+        self._update()
+        self._angle += rotation_angle
+
+    def run_target(self, speed, target_angle, then=None, wait=True):
+        self._update()
+        self._angle = float(target_angle)
+
+
+class _StubSensor:
+    READINGS = (38, 41, 45, 47, 44, 40, 36, 39)
+
+    def __init__(self, world, phase, dark_from=None):
+        self._world = world
+        self._index = phase
+        self._reads = 0
+        self._dark_from = dark_from
+
+    def reflection(self):
+        self._world.now_us += 100
+        self._reads += 1
+        dark = self._dark_from
+        if dark is not None and dark <= self._reads < dark + 5:
+            return 5  # A junction passing under the sensor
+        self._index = (self._index + 1) & 7
+        return self.READINGS[self._index]
+
+
+# name, Robot keyword arguments, call(robot, polling_rate), nominal polling rate,
+# start pose on the simulated mat
+CASES = (
+    ("line_trace_time", {}, lambda r, p: r.line_trace_time(2000, 1, 0.3, polling_rate=p), 5, (150, 300, 0)),
+    ("line_trace_junction", {}, lambda r, p: r.line_trace_junction(1, 0.6, polling_rate=p), 10, (150, 300, 0)),
+    ("turn_arc", {"acceleration": 8000}, lambda r, p: r.turn_arc(-95), 5, (150, 300, 0)),
+    ("move_rotations", {"acceleration": 8000}, lambda r, p: r.move_rotations(3), 5, (150, 300, 0)),
+    ("move_time", {}, lambda r, p: r.move_time(1000, ease_in=True, ease_out=True, polling_rate=p), 10, (150, 300, 0)),
+    ("bump_align", {}, lambda r, p: r.bump_align(polling_rate=p), 10, (300, 300, 0)),
+    ("move_aux_stall", {}, lambda r, p: r.move_aux_stall(1, polling_rate=p), 10, (150, 300, 0)),
+)
+ROBOT = {"trace_speed": 800, "turning_const": 2.76}
+_NO_TRACK = evsim.Track(1, 1)
+CPU_SLICE = 0.02  # CPU seconds per timed slice
+
+
+def _stub_robot(name, options):
+    from evpylib import Robot
+    # The physics never steps, so waits only move the clock, and nothing reads the track
+    world = evsim.reset(track=_NO_TRACK, step_us=10 ** 9, io_latency=False, time_limit=3600)
+    limit = 720 if name == "bump_align" else None
+    devices = {
+        "left_motor": _StubMotor(world, limit),
+        "right_motor": _StubMotor(world, limit),
+        "aux_motor_1": _StubMotor(world, 150),
+        "aux_motor_2": None,
+        "left_sensor": _StubSensor(world, 0, 3000 if name == "line_trace_junction" else None),
+        "right_sensor": _StubSensor(world, 3),
+        "aux_sensor_1": None,
+        "aux_sensor_2": None,
+    }
+    return Robot(devices, **dict(ROBOT, **options)), devices
+
+
+def measure_cpu(case, min_cpu=CPU_SLICE):
+    """Returns (ticks, cpu seconds, retained blocks) over repeated free-running calls."""
+    name, options, call, _, _ = case
+    ticks = 0
+    cpu = 0.0
+    blocks = 0
+    while cpu < min_cpu:
+        robot, devices = _stub_robot(name, options)
+        counter = devices["aux_motor_1"] if name == "move_aux_stall" else devices["left_motor"]
+        with redirect_stdout(io.StringIO()):
+            gc.collect()
+            before = sys.getallocatedblocks()
+            start = time.process_time()
+            call(robot, 0)
+            cpu += time.process_time() - start
+            gc.collect()
+            blocks += sys.getallocatedblocks() - before
+        ticks += counter.reads if name == "move_aux_stall" else counter.runs
+    return ticks, cpu, blocks
+
+
+def measure_reference(min_cpu=CPU_SLICE):
+    """Returns CPU microseconds per tick of a plain proportional line follower over the stubs."""
+    world = evsim.reset(track=_NO_TRACK, step_us=10 ** 9, io_latency=False, time_limit=3600)
+    left, right = _StubMotor(world), _StubMotor(world)
+    left_sensor, right_sensor = _StubSensor(world, 0), _StubSensor(world, 3)
+    ticks = 0
+    cpu = 0.0
+    while cpu < min_cpu:
+        start = time.process_time()
+        for _ in range(2000):
+            error = left_sensor.reflection() - right_sensor.reflection()
+            turn = 0.3 * error
+            left.run(int(800 + turn))
+            right.run(int(800 - turn))
+        cpu += time.process_time() - start
+        ticks += 2000
+    return 1e6 * cpu / ticks
+
+
+def measure_sim(case):
+    """
+    Returns (virtual seconds, mean period ms, p99 period ms, reads saved per tick, device
+    calls per tick, device calls) on the simulated mat. The per-tick figures are None for
+    methods that run no control loop.
+    """
+    from pybricks.ev3devices import Motor, ColorSensor
+    from pybricks.parameters import Port, Direction
+    from evpylib import Robot
+    from diagnostics import LoopProfiler
+
+    name, options, call, polling_rate, start = case
+    world = evsim.reset(start=start, seed=0)
+    devices = {
+        "left_motor": Motor(Port.C, positive_direction=Direction.COUNTERCLOCKWISE),
+        "right_motor": Motor(Port.B, positive_direction=Direction.CLOCKWISE),
+        "aux_motor_1": Motor(Port.D),
+        "aux_motor_2": Motor(Port.A),
+        "left_sensor": ColorSensor(Port.S2),
+        "right_sensor": ColorSensor(Port.S1),
+        "aux_sensor_1": ColorSensor(Port.S3),
+        "aux_sensor_2": ColorSensor(Port.S4),
+    }
+    profiler = LoopProfiler(4000)
+    robot = Robot(devices, profiler=profiler, **dict(ROBOT, **options))
+    begin = world.now_us
+    calls = world.device_calls
+    with redirect_stdout(io.StringIO()):
+        call(robot, polling_rate)
+    calls = world.device_calls - calls
+    period = profiler.report()["period"] if profiler.count > 1 else None
+    return ((world.now_us - begin) / 1e6,
+            period[1] / 1000 if period else None,
+            period[2] / 1000 if period else None,
+            robot.snapshot.saved_per_tick() if robot.snapshot else 0,
+            calls / profiler.count if profiler.count > 1 else None,
+            calls)
+
+
+def measure_routine(script):
+    """Returns (virtual seconds, virtual seconds to the first motor command, device calls)."""
+    world = evsim.reset(seed=0)
+    with redirect_stdout(io.StringIO()):
+        virtual, _ = simulate.run(script, world)
+    return virtual, (world.first_write_us or 0) / 1e6, world.device_calls
+
+
+def _launch_modules(program):
+    """
+    Returns {module: (source, path)} of the library modules `program` imports when it starts:
+    those imported at module level, followed through the library, but not those imported
+    inside functions.
+    """
+    modules = {}
+    pending = [program]
+    while pending:
+        path = pending.pop()
+        with open(path) as f:
+            source = f.read()
+        modules[os.path.splitext(os.path.basename(path))[0]] = (source, path)
+        statements = list(ast.parse(source).body)
+        while statements:
+            node = statements.pop()
+            if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                continue
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                names = [node.module]
+            else:
+                statements.extend(child for child in ast.iter_child_nodes(node) if isinstance(child, ast.stmt))
+                continue
+            for name in names:
+                target = os.path.join(simulate.CODE_DIR, name + ".py")
+                if name not in modules and os.path.exists(target):
+                    pending.append(target)
+    del modules[os.path.splitext(os.path.basename(program))[0]]
+    return modules
+
+
+def measure_compile(repeat):
+    """Returns (best host time in ms to compile the modules main.py loads at launch, their names)."""
+    modules = _launch_modules(os.path.join(simulate.CODE_DIR, "main.py"))
+    sources = list(modules.values())
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        for source, path in sources:
+            compile(source, path, "exec")
+        elapsed = time.process_time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000, sorted(modules)
+
+
+def run(repeat):
+    results = {}
+    for case in CASES:
+        # Short slices of the method and the reference loop alternate, so both see the same
+        # machine load, and the fastest slice of each is kept
+        best = None
+        reference = None
+        for _ in range(repeat):
+            us = measure_reference(CPU_SLICE)
+            if reference is None or us < reference:
+                reference = us
+            ticks, cpu, blocks = measure_cpu(case, CPU_SLICE)
+            if best is None or cpu / ticks < best[1] / best[0]:
+                best = (ticks, cpu, blocks)
+        ticks, cpu, blocks = best
+        sim_s, period, p99, saved, calls_per_tick, calls = measure_sim(case)
+        results[case[0]] = {
+            "ticks_per_s": ticks / cpu,
+            "us_per_tick": 1e6 * cpu / ticks,
+            "cpu_ratio": 1e6 * cpu / ticks / reference,
+            "blocks_per_tick": blocks / ticks,
+            "period_ms": period,
+            "period_p99_ms": p99,
+            "sim_s": sim_s,
+            "calls_per_tick": calls_per_tick,
+            "device_calls": calls,
+            "saved_per_tick": saved,
+        }
+    routine, startup, calls = measure_routine(os.path.join(simulate.CODE_DIR, "main.py"))
+    results["routine"] = {"sim_s": routine, "device_calls": calls}
+    compile_ms, modules = measure_compile(repeat)
+    results["startup"] = {"sim_s": startup, "compile_ms": compile_ms, "modules": modules}
+    return results
+
+
+def compare(results, baseline, cpu_tolerance, sim_tolerance):
+    """Returns a list of regression messages."""
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if "cpu_ratio" in base and result["cpu_ratio"] > base["cpu_ratio"] * (1 + cpu_tolerance):
+            problems.append("{}: {:.2f} x the reference loop per tick, baseline {:.2f}".format(
+                name, result["cpu_ratio"], base["cpu_ratio"]))
+        if base.get("calls_per_tick") and result["calls_per_tick"] and \
+                result["calls_per_tick"] > base["calls_per_tick"] * (1 + sim_tolerance) + 0.01:
+            problems.append("{}: {:.2f} device calls per tick, baseline {:.2f}".format(
+                name, result["calls_per_tick"], base["calls_per_tick"]))
+        if "device_calls" in base and result["device_calls"] > base["device_calls"] * (1 + sim_tolerance):
+            problems.append("{}: {} device calls, baseline {}".format(name, result["device_calls"], base["device_calls"]))
+        if result["sim_s"] > base["sim_s"] * (1 + sim_tolerance) + 0.001:
+            problems.append("{}: takes {:.3f} s, baseline {:.3f}".format(name, result["sim_s"], base["sim_s"]))
+        if base.get("period_p99_ms") and result["period_p99_ms"] and \
+                result["period_p99_ms"] > base["period_p99_ms"] * (1 + sim_tolerance) + 0.05:
+            problems.append("{}: p99 period {:.2f} ms, baseline {:.2f}".format(name, result["period_p99_ms"], base["period_p99_ms"]))
+    return problems
+
+
+def print_results(results):
+    print("{:20} {:>10} {:>9} {:>6} {:>12} {:>10} {:>10} {:>8} {:>11} {:>11}".format(
+        "method", "ticks/s", "us/tick", "cpu x", "blocks/tick", "period ms", "p99 ms", "sim s",
+        "calls/tick", "saved/tick"))
+    for name, r in results.items():
+        if name in ("routine", "startup"):
+            continue
+        print("{:20} {:10.0f} {:9.2f} {:6.2f} {:12.3f} {:>10} {:>10} {:8.3f} {:>11} {:11.2f}".format(
+            name, r["ticks_per_s"], r["us_per_tick"], r["cpu_ratio"], r["blocks_per_tick"],
+            "-" if r["period_ms"] is None else "{:.2f}".format(r["period_ms"]),
+            "-" if r["period_p99_ms"] is None else "{:.2f}".format(r["period_p99_ms"]), r["sim_s"],
+            "{} total".format(r["device_calls"]) if r["calls_per_tick"] is None else "{:.2f}".format(r["calls_per_tick"]),
+            r["saved_per_tick"]))
+    print("Reference routine (main.py): {:.3f} s, {} device calls".format(
+        results["routine"]["sim_s"], results["routine"]["device_calls"]))
+    startup = results["startup"]
+    print("Startup (main.py): {:.3f} s to the first motor command with the simulator's estimated device "
+          "costs, compiling {} {:.1f} ms on this host".format(
+              startup["sim_s"], ", ".join(startup["modules"]), startup["compile_ms"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--repeat", type=int, default=20, help="CPU slices per method, the best is kept")
+    parser.add_argument("--cpu-tolerance", type=float, default=0.4,
+                        help="fractional CPU slowdown against the reference loop allowed before failing")
+    parser.add_argument("--sim-tolerance", type=float, default=0.01,
+                        help="fractional increase in simulated time, period or device calls allowed before failing")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    print_results(results)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Saved the baseline to {}".format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {}, run with --save to create one.".format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    problems = compare(results, baseline, args.cpu_tolerance, args.sim_tolerance)
+    for problem in problems:
+        print("REGRESSION " + problem)
+    if not problems:
+        print("No regressions against {}".format(args.baseline))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
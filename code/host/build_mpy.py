@@ -0,0 +1,78 @@
+"""
+Precompiles the robot library to .mpy bytecode for the brick and optionally copies it over.
+
+    python code/host/build_mpy.py                                   # build into build/ev3
+    python code/host/build_mpy.py --deploy robot@ev3dev.local:/home/robot/GTN-WRO
+
+pybricks-micropython compiles every imported .py file from source each time a program
+starts, which for evpylib takes a noticeable part of the wait before the robot moves.
+An .mpy file is loaded as ready-made bytecode. The build directory gets `main.py` as
+source, since the brick runs it as the program, and the library modules as .mpy files.
+
+mpy-cross has to come from the MicroPython release the brick's pybricks-micropython is
+built on (`pybricks-micropython -c "import sys; print(sys.implementation)"` on the brick
+prints it); the brick refuses .mpy files of another version with "incompatible .mpy file".
+MicroPython imports a .py before an .mpy of the same name, so --deploy also removes the
+library sources from the brick's project directory.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+import simulate
+
+BUILD_DIR = os.path.join(os.path.dirname(simulate.CODE_DIR), "build", "ev3")
+LIBRARY = ("evpylib", "motion", "control", "routine", "snapshot", "colour", "trackmap", "diagnostics")
+PROGRAM = "main.py"
+
+
+def build(out_dir, mpy_cross="mpy-cross", modules=LIBRARY):
+    """Compiles the library modules into out_dir next to a copy of main.py and returns the files."""
+    os.makedirs(out_dir, exist_ok=True)
+    files = []
+    for module in modules:
+        source = os.path.join(simulate.CODE_DIR, module + ".py")
+        target = os.path.join(out_dir, module + ".mpy")
+        subprocess.run([mpy_cross, "-o", target, "-s", module + ".py", source], check=True)
+        files.append(target)
+    program = os.path.join(out_dir, PROGRAM)
+    shutil.copyfile(os.path.join(simulate.CODE_DIR, PROGRAM), program)
+    files.append(program)
+    return files
+
+
+def deploy(files, destination, modules=LIBRARY):
+    """Copies the built files to host:directory over ssh and removes the library sources there."""
+    host, _, directory = destination.partition(":")
+    if not host or not directory:
+        raise ValueError("Destination must be host:directory, got {!r}.".format(destination))
+    stale = " ".join("'{}/{}.py'".format(directory, module) for module in modules)
+    subprocess.run(["ssh", host, "mkdir -p '{}' && rm -f {}".format(directory, stale)], check=True)
+    subprocess.run(["scp"] + files + [destination], check=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--out", default=BUILD_DIR, help="build directory (default build/ev3)")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross executable")
+    parser.add_argument("--deploy", metavar="HOST:DIR", help="copy the build to the brick over ssh")
+    args = parser.parse_args(argv)
+
+    if shutil.which(args.mpy_cross) is None:
+        print("{} not found. Install the release matching the brick's MicroPython, "
+              "e.g. pip install mpy-cross==<version>.".format(args.mpy_cross), file=sys.stderr)
+        return 1
+    files = build(args.out, args.mpy_cross)
+    for path in files:
+        print("{:40} {:7} bytes".format(os.path.relpath(path), os.path.getsize(path)))
+    if args.deploy:
+        deploy(files, args.deploy)
+        print("Deployed to {}".format(args.deploy))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
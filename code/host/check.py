@@ -0,0 +1,67 @@
+"""
+Checks behaviour the benchmark does not measure, in the simulator, and fails when any breaks.
+
+    python code/host/check.py
+
+Each check runs a short scene on the `evsim` mat and returns a list of problems, empty when
+the behaviour is right. bench.py only times moves and counts their device calls; what has
+to stay correct rather than fast is checked here.
+"""
+
+import argparse
+import io
+import sys
+from contextlib import redirect_stdout
+
+import simulate  # noqa: F401  (puts the stand-in pybricks and the library on sys.path)
+import evsim
+
+
+def check_background_start():
+    """
+    Returns problems with reads made between moves, which must see the devices as they are
+    now. Starts an aux stall in the background, lets time pass outside any control loop and
+    starts a second one, which has to travel its full range rather than take its start
+    time from the first.
+    """
+    from pybricks.ev3devices import Motor
+    from pybricks.parameters import Port
+    from evpylib import Robot
+
+    layout = evsim.Layout()
+    layout.acceleration = 1000  # A slow start, which a stale start time takes for a stall
+    world = evsim.reset(start=(150, 300, 0), layout=layout, seed=0)
+    devices = {"left_motor": Motor(Port.C), "right_motor": Motor(Port.B),
+               "aux_motor_1": Motor(Port.D), "aux_motor_2": Motor(Port.A),
+               "left_sensor": None, "right_sensor": None, "aux_sensor_1": None, "aux_sensor_2": None}
+    robot = Robot(devices)
+    with redirect_stdout(io.StringIO()):
+        robot.move_aux_stall(1, background=True)
+        world.advance(500000)
+        robot.move_aux_stall(2, background=True)
+        robot.join()
+    travel = layout.aux_ports["A"][1]
+    angle = robot.aux_motor_2.angle()
+    if angle < travel - 5:
+        return ["background start: aux motor 2 stopped at {} of {} degrees".format(angle, travel)]
+    return []
+
+
+CHECKS = (check_background_start,)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.parse_args(argv)
+    problems = []
+    for check in CHECKS:
+        problems += check()
+    for problem in problems:
+        print("FAIL " + problem)
+    if not problems:
+        print("All {} checks passed".format(len(CHECKS)))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+"""
+Host-side simulation of the EV3 robot behind the `pybricks` stand-in package.
+
+The world owns a virtual clock in microseconds. Nothing here sleeps: `wait()`,
+blocking motor commands and simulated device I/O all move the clock forward,
+and the physics (motors, differential drive, walls) is integrated in fixed
+steps as the clock advances. Color sensors read a 2D track image.
+
+Typical use from a host script:
+
+    import evsim
+    evsim.reset(track=evsim.Track.default_mat(), start=(150, 300, 0))
+    ... run code that imports pybricks ...
+    print(evsim.world().now_ms())
+"""
+
+import math
+import random
+
+# Motor control modes
+COAST = 0
+BRAKE = 1
+HOLD = 2
+RUN = 3
+TARGET = 4
+
+
+class SimulationTimeout(Exception):
+    """Raised when the virtual clock passes the world's time limit."""
+
+
+class Track:
+    """
+    RGB track image with a millimetre scale, sampled by the simulated color sensors.
+
+    Parameters:
+    - width, height: image size in pixels
+    - mm_per_px: float, millimetres covered by one pixel
+    - background: (r, g, b) tuple, 0-255 fill colour
+    """
+
+    def __init__(self, width, height, mm_per_px=1.0, background=(255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.mm_per_px = mm_per_px
+        self.pixels = bytearray(bytes(background) * (width * height))
+        self._reflection = None
+
+    @property
+    def width_mm(self):
+        return self.width * self.mm_per_px
+
+    @property
+    def height_mm(self):
+        return self.height * self.mm_per_px
+
+    def set_pixel(self, px, py, colour):
+        if 0 <= px < self.width and 0 <= py < self.height:
+            i = 3 * (py * self.width + px)
+            self.pixels[i:i + 3] = bytes(colour)
+            self._reflection = None
+
+    def draw_segment(self, x0, y0, x1, y1, thickness=20, colour=(0, 0, 0)):
+        """
+        Draws a straight line with round ends. Coordinates are in mm, y pointing up.
+        """
+        s = 1.0 / self.mm_per_px
+        ax, ay, bx, by = x0 * s, y0 * s, x1 * s, y1 * s
+        r = thickness * s / 2
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy or 1e-9
+        value = bytes(colour)
+        for py in range(max(0, int(min(ay, by) - r)), min(self.height, int(max(ay, by) + r) + 1)):
+            row = (self.height - 1 - py) * self.width
+            for px in range(max(0, int(min(ax, bx) - r)), min(self.width, int(max(ax, bx) + r) + 1)):
+                t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+                t = 0.0 if t < 0 else 1.0 if t > 1 else t
+                ex, ey = px - (ax + t * dx), py - (ay + t * dy)
+                if ex * ex + ey * ey <= r * r:
+                    i = 3 * (row + px)
+                    self.pixels[i:i + 3] = value
+        self._reflection = None
+
+    def draw_arc(self, cx, cy, radius, start_deg, end_deg, thickness=20, colour=(0, 0, 0)):
+        """
+        Draws a circular arc as a chain of short segments. Angles are counter-clockwise from +x.
+        """
+        steps = max(2, int(abs(end_deg - start_deg) * radius / 360.0))
+        last = None
+        for k in range(steps + 1):
+            a = math.radians(start_deg + (end_deg - start_deg) * k / steps)
+            point = (cx + radius * math.cos(a), cy + radius * math.sin(a))
+            if last:
+                self.draw_segment(last[0], last[1], point[0], point[1], thickness, colour)
+            last = point
+
+    def rgb_at(self, x, y):
+        """Returns the (r, g, b) pixel at (x, y) in mm, white outside the image."""
+        px = int(x / self.mm_per_px)
+        py = self.height - 1 - int(y / self.mm_per_px)
+        if 0 <= px < self.width and 0 <= py < self.height:
+            i = 3 * (py * self.width + px)
+            return self.pixels[i], self.pixels[i + 1], self.pixels[i + 2]
+        return 255, 255, 255
+
+    def reflection_map(self):
+        """
+        Returns a bytearray of 0-255 red-channel intensities, one per pixel.
+        The EV3 sensor measures reflection under a red LED, so red is what it sees.
+        """
+        if self._reflection is None:
+            self._reflection = bytearray(self.pixels[0::3])
+        return self._reflection
+
+    @classmethod
+    def load(cls, path, mm_per_px=1.0):
+        """
+        Loads a binary or ASCII PPM (P6/P3) or PGM (P5/P2) image.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        tokens = []
+        pos = 0
+        while len(tokens) < 4:
+            while data[pos:pos + 1].isspace():
+                pos += 1
+            if data[pos:pos + 1] == b"#":
+                pos = data.index(b"\n", pos)
+                continue
+            end = pos
+            while not data[end:end + 1].isspace():
+                end += 1
+            tokens.append(data[pos:end])
+            pos = end
+        magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+        if magic not in (b"P2", b"P3", b"P5", b"P6"):
+            raise ValueError("Unsupported image format {!r}, use PPM or PGM.".format(magic))
+        channels = 3 if magic in (b"P3", b"P6") else 1
+        if magic in (b"P5", b"P6"):
+            if maxval > 255:
+                raise ValueError("Only 8-bit PPM/PGM images are supported.")
+            raw = data[pos + 1:pos + 1 + width * height * channels]
+        else:
+            raw = bytes(int(v) * 255 // maxval for v in data[pos:].split()[:width * height * channels])
+        track = cls(width, height, mm_per_px)
+        if channels == 3:
+            track.pixels[:] = raw
+        else:
+            track.pixels[0::3] = raw
+            track.pixels[1::3] = raw
+            track.pixels[2::3] = raw
+        return track
+
+    def save(self, path):
+        """Saves the track as a binary PPM image."""
+        with open(path, "wb") as f:
+            f.write("P6\n{} {}\n255\n".format(self.width, self.height).encode())
+            f.write(self.pixels)
+
+    @classmethod
+    def default_mat(cls):
+        """
+        A 2362 x 1143 mm mat laid out for `main.normal_routine()`: a line along y=300 with a
+        branch to the left at x=900 that runs up the mat and bends right near the top.
+        """
+        track = cls(2362, 1143)
+        track.draw_segment(50, 300, 2200, 300)
+        track.draw_segment(900, 300, 900, 800)
+        track.draw_arc(1100, 800, 200, 180, 90)
+        track.draw_segment(1100, 1000, 2200, 1000)
+        return track
+
+    @classmethod
+    def oval(cls, straight=1200, radius=300, thickness=20):
+        """
+        A closed oval of two straights joined by half circles, for lap timing and gain tuning.
+        The line starts at (radius + 200, 200) heading along +x.
+        """
+        margin = 200
+        track = cls(int(straight + 2 * radius + 2 * margin), int(2 * radius + 2 * margin))
+        x0, x1 = radius + margin, radius + margin + straight
+        y0, y1 = margin, margin + 2 * radius
+        track.draw_segment(x0, y0, x1, y0, thickness)
+        track.draw_segment(x0, y1, x1, y1, thickness)
+        track.draw_arc(x1, margin + radius, radius, -90, 90, thickness)
+        track.draw_arc(x0, margin + radius, radius, 90, 270, thickness)
+        return track
+
+
+class Layout:
+    """
+    Physical description of the simulated robot and what is plugged into each port.
+
+    Distances are in mm, relative to the midpoint of the drive axle, x forward and y to the left.
+    The default matches the competition robot: drive motors on C (left) and B (right), line
+    sensors on S1 and S2, attachment motors on D and A and object sensors on S3 and S4.
+    S1 sits on the physical left of the line; `main.py` names it `right_sensor`, which is what
+    makes the "balance" error sign steer back towards the line.
+    """
+
+    def __init__(self):
+        self.wheel_diameter = 56.0
+        self.axle_track = 155.0
+        self.body_front = 110.0
+        self.body_rear = 60.0
+        self.body_half_width = 85.0
+        self.drive_ports = {"C": ("left", "COUNTERCLOCKWISE"), "B": ("right", "CLOCKWISE")}
+        self.aux_ports = {"D": (-150.0, 150.0), "A": (-150.0, 150.0)}
+        self.sensor_ports = {
+            "S1": (45.0, 16.0),
+            "S2": (45.0, -16.0),
+            "S3": (120.0, 60.0),
+            "S4": (120.0, -60.0),
+        }
+        self.drive_max_speed = 1050.0
+        self.aux_max_speed = 1560.0
+        self.acceleration = 8000.0
+        self.sensor_noise = 0.5
+        # Virtual time charged for each device access, standing in for ev3dev sysfs I/O.
+        # Building a device probes its port and sets it up, which takes far longer; these are
+        # rough estimates, not timings taken on a brick, there to make startup show up in the
+        # simulated time. Startup figures built on them show the direction of a change only.
+        self.io_cost_us = {"motor_read": 150, "motor_write": 200, "sensor_read": 400,
+                           "motor_init": 40000, "sensor_init": 40000, "brick_init": 80000}
+
+
+class SimMotor:
+    """State of one simulated motor. Angles and speeds are in the user-facing direction."""
+
+    HOLD_GAIN = 25.0
+    COAST_DECEL = 3000.0
+    BRAKE_DECEL = 12000.0
+    STALL_SPEED = 20.0
+    STALL_TIME = 0.2
+
+    def __init__(self, port, max_speed, acceleration, sign=1, limits=None):
+        self.port = port
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.sign = sign
+        self.limits = limits
+        self.angle = 0.0
+        self.speed = 0.0
+        self.mode = COAST
+        self.target_speed = 0.0
+        self.target_angle = 0.0
+        self.cruise = 0.0
+        self.then = HOLD
+        self.hold_angle = 0.0
+        self.done = True
+        self.stall_time = 0.0
+        self.blocked = False
+
+    def command(self, mode, speed=0.0, target=None, then=HOLD):
+        speed = max(-self.max_speed, min(self.max_speed, speed))
+        self.mode = mode
+        self.stall_time = 0.0
+        if mode == RUN:
+            self.target_speed = speed
+            self.done = False
+        elif mode == TARGET:
+            self.target_angle = target
+            self.cruise = abs(speed)
+            self.then = then
+            self.done = False
+        else:
+            self.hold_angle = self.angle
+            self.done = True
+
+    def _finish(self):
+        self.done = True
+        if self.then == HOLD:
+            self.mode = HOLD
+            self.hold_angle = self.target_angle
+        else:
+            self.mode = self.then
+
+    def step(self, dt):
+        """Integrates one physics step and returns the change in angle."""
+        mode = self.mode
+        accel = self.acceleration
+        if mode == RUN:
+            desired = self.target_speed
+        elif mode == TARGET:
+            remaining = self.target_angle - self.angle
+            if abs(remaining) <= max(0.5, abs(self.speed) * dt):
+                self.angle = self.target_angle
+                self._finish()
+                if self.mode != COAST:
+                    self.speed = 0.0
+                return remaining
+            desired = math.copysign(min(self.cruise, math.sqrt(2 * accel * abs(remaining))), remaining)
+        elif mode == HOLD:
+            desired = self.HOLD_GAIN * (self.hold_angle - self.angle)
+            desired = max(-self.max_speed, min(self.max_speed, desired))
+            accel = self.BRAKE_DECEL
+        elif mode == BRAKE:
+            desired = 0.0
+            accel = self.BRAKE_DECEL
+        else:
+            desired = 0.0
+            accel = self.COAST_DECEL
+
+        speed = self.speed
+        limit = accel * dt
+        diff = desired - speed
+        speed += limit if diff > limit else -limit if diff < -limit else diff
+        self.speed = speed
+        delta = speed * dt
+
+        limits = self.limits
+        if limits is not None:
+            new_angle = self.angle + delta
+            if new_angle < limits[0] or new_angle > limits[1]:
+                new_angle = max(limits[0], min(limits[1], new_angle))
+                delta = new_angle - self.angle
+                self.speed = 0.0
+        self.angle += delta
+
+        commanded = (mode == RUN or mode == TARGET) and abs(desired) > self.STALL_SPEED
+        if commanded and abs(self.speed) < self.STALL_SPEED:
+            self.stall_time += dt
+            if mode == TARGET and self.stall_time >= self.STALL_TIME:
+                self.target_angle = self.angle
+                self._finish()
+        else:
+            self.stall_time = 0.0
+        return delta
+
+    def stalled(self):
+        return self.stall_time >= self.STALL_TIME
+
+
+class World:
+    """
+    The simulated robot on its mat, driven by a virtual clock.
+
+    Parameters:
+    - track: Track the line sensors read, defaults to `Track.default_mat()`
+    - start: (x, y, heading) of the axle midpoint in mm and degrees, counter-clockwise from +x
+    - layout: Layout, defaults to the competition robot
+    - step_us: physics integration step in microseconds
+    - io_latency: bool, charge virtual time for device reads and writes
+    - time_limit: float, seconds of virtual time before SimulationTimeout is raised
+    - seed: int, seed for sensor noise
+    """
+
+    def __init__(self, track=None, start=(150.0, 300.0, 0.0), layout=None, step_us=2000,
+                 io_latency=True, time_limit=600.0, seed=0):
+        self.track = track if track is not None else Track.default_mat()
+        self.layout = layout if layout is not None else Layout()
+        self.x, self.y = float(start[0]), float(start[1])
+        self.heading = math.radians(start[2])
+        self.step_us = step_us
+        self.io_latency = io_latency
+        self.time_limit_us = int(time_limit * 1e6)
+        self.rng = random.Random(seed)
+        self.now_us = 0
+        self.physics_us = 0
+        self.motors = {}
+        self.left = None
+        self.right = None
+        self.path = None
+        self.path_interval_us = 0
+        self._next_path_us = 0
+        self.device_calls = 0
+        self.first_write_us = None  # When the first motor command was sent, for startup timing
+        self._timers = []
+
+        wheel = self.layout.wheel_diameter
+        self._mm_per_deg = math.pi * wheel / 360.0
+        # Inside this box no corner of the body can touch a wall, so the corner check is skipped.
+        reach = math.hypot(max(self.layout.body_front, self.layout.body_rear), self.layout.body_half_width)
+        self._clear = (reach, self.track.width_mm - reach, reach, self.track.height_mm - reach)
+        self.track.reflection_map()
+
+    # Clock
+
+    def now_ms(self):
+        return self.now_us // 1000
+
+    def advance(self, us):
+        """Moves the virtual clock forward by `us` microseconds, integrating physics on the way."""
+        target = self.now_us + int(us)
+        if target > self.time_limit_us:
+            raise SimulationTimeout("Virtual time passed {} s.".format(self.time_limit_us / 1e6))
+        step = self.step_us
+        if self.physics_us + step <= target:
+            dt = step / 1e6
+            motors = self.motors.values()
+            path = self.path
+            timers = self._timers
+            while self.physics_us + step <= target:
+                self.physics_us += step
+                self._step(dt, motors)
+                if timers and self.physics_us >= timers[0][0]:
+                    self._fire_timers()
+                if path is not None and self.physics_us >= self._next_path_us:
+                    path.append((self.physics_us, self.x, self.y, math.degrees(self.heading)))
+                    self._next_path_us = self.physics_us + self.path_interval_us
+        self.now_us = target
+
+    def schedule(self, at_us, callback):
+        """Calls `callback()` once the physics reaches `at_us`, standing in for firmware-side timers."""
+        self._timers.append((at_us, callback))
+        self._timers.sort(key=lambda timer: timer[0])
+
+    def _fire_timers(self):
+        while self._timers and self.physics_us >= self._timers[0][0]:
+            self._timers.pop(0)[1]()
+
+    def io(self, kind):
+        """Charges the virtual time cost of one device access."""
+        self.device_calls += 1
+        if self.io_latency:
+            self.advance(self.layout.io_cost_us[kind])
+        if kind == "motor_write" and self.first_write_us is None:
+            self.first_write_us = self.now_us
+
+    def wait_until(self, predicate):
+        """Advances the clock one physics step at a time until `predicate()` is true."""
+        while not predicate():
+            self.advance(self.step_us)
+
+    def record_path(self, interval_ms=20):
+        """Starts sampling (time_us, x, y, heading) into `self.path`."""
+        self.path = []
+        self.path_interval_us = interval_ms * 1000
+        self._next_path_us = self.physics_us
+
+    # Physics
+
+    def _step(self, dt, motors):
+        left, right = self.left, self.right
+        left_angle = left.angle if left else 0.0
+        right_angle = right.angle if right else 0.0
+        for motor in motors:
+            mode = motor.mode
+            if motor.speed or mode > HOLD or (mode == HOLD and motor.angle != motor.hold_angle):
+                motor.step(dt)
+        if left is None or right is None:
+            return
+        dl = (left.angle - left_angle) * left.sign * self._mm_per_deg
+        dr = (right.angle - right_angle) * right.sign * self._mm_per_deg
+        if dl == 0.0 and dr == 0.0:
+            return
+        distance = (dl + dr) / 2
+        heading = self.heading + (dr - dl) / self.layout.axle_track
+        mid = (self.heading + heading) / 2
+        x = self.x + distance * math.cos(mid)
+        y = self.y + distance * math.sin(mid)
+        x_min, x_max, y_min, y_max = self._clear
+        if (x_min < x < x_max and y_min < y < y_max) or self._inside(x, y, heading):
+            self.x, self.y, self.heading = x, y, heading
+        else:
+            # Pushing into a wall: the wheels stop turning and the motors stall.
+            for motor, previous in ((left, left_angle), (right, right_angle)):
+                motor.angle = previous
+                motor.speed = 0.0
+
+    def _inside(self, x, y, heading):
+        w, h = self.track.width_mm, self.track.height_mm
+        lay = self.layout
+        c, s = math.cos(heading), math.sin(heading)
+        for fx in (lay.body_front, -lay.body_rear):
+            for fy in (lay.body_half_width, -lay.body_half_width):
+                cx = x + fx * c - fy * s
+                cy = y + fx * s + fy * c
+                if not (0 <= cx <= w and 0 <= cy <= h):
+                    return False
+        return True
+
+    # Devices
+
+    def attach_motor(self, port, positive_direction):
+        lay = self.layout
+        if port in lay.drive_ports:
+            side, forward = lay.drive_ports[port]
+            sign = 1 if positive_direction == forward else -1
+            motor = SimMotor(port, lay.drive_max_speed, lay.acceleration, sign)
+            setattr(self, side, motor)
+        elif port in lay.aux_ports:
+            motor = SimMotor(port, lay.aux_max_speed, lay.acceleration, 1, lay.aux_ports[port])
+        else:
+            raise OSError("No motor connected to port {}.".format(port))
+        self.motors[port] = motor
+        return motor
+
+    def sensor_position(self, port):
+        if port not in self.layout.sensor_ports:
+            raise OSError("No sensor connected to port {}.".format(port))
+        fx, fy = self.layout.sensor_ports[port]
+        c, s = math.cos(self.heading), math.sin(self.heading)
+        return self.x + fx * c - fy * s, self.y + fx * s + fy * c
+
+    def reflection(self, port):
+        """Reflected light 0-100 seen by the sensor on `port`, averaged over a small spot."""
+        x, y = self.sensor_position(port)
+        track = self.track
+        refl = track.reflection_map()
+        width, height, scale = track.width, track.height, 1.0 / track.mm_per_px
+        total = 0
+        for ox, oy in ((0, 0), (1.5, 0), (-1.5, 0), (0, 1.5), (0, -1.5)):
+            px = int((x + ox) * scale)
+            py = height - 1 - int((y + oy) * scale)
+            total += refl[py * width + px] if 0 <= px < width and 0 <= py < height else 255
+        # A real sensor reads roughly 5 on black and 80 on white paper.
+        value = 5 + total * 75.0 / (5 * 255)
+        if self.layout.sensor_noise:
+            value += self.rng.gauss(0, self.layout.sensor_noise)
+        return int(max(0, min(100, round(value))))
+
+    def rgb(self, port):
+        x, y = self.sensor_position(port)
+        noise = self.layout.sensor_noise
+        values = []
+        for c in self.track.rgb_at(x, y):
+            value = 5 + c * 75.0 / 255
+            if noise:
+                value += self.rng.gauss(0, noise)
+            values.append(int(max(0, min(100, round(value)))))
+        return tuple(values)
+
+
+_world = None
+
+
+def world():
+    """Returns the current World, creating a default one on first use."""
+    global _world
+    if _world is None:
+        _world = World()
+    return _world
+
+
+def reset(**kwargs):
+    """Replaces the current World. Takes the same arguments as `World`."""
+    global _world
+    _world = World(**kwargs)
+    return _world
@@ -0,0 +1,6 @@
+"""
+Host stand-in for the pybricks EV3 API, backed by the `evsim` virtual clock and physics.
+
+Put `code/host` ahead of everything else on `sys.path` and `evpylib`/`main.py` run unchanged.
+Only the parts of the API the robot code uses are provided.
+"""
@@ -0,0 +1,164 @@
+"""Stand-in for `pybricks.ev3devices`, backed by the simulated world."""
+
+import evsim
+from pybricks.parameters import Direction, Stop, Color
+
+
+class _Control:
+    def __init__(self, motor):
+        self._motor = motor
+
+    def done(self):
+        return self._motor.done
+
+    def stalled(self):
+        return self._motor.stalled()
+
+    def limits(self, speed=None, acceleration=None, actuation=None):
+        if speed is None and acceleration is None:
+            return self._motor.max_speed, self._motor.acceleration, 100
+        if speed is not None:
+            self._motor.max_speed = speed
+        if acceleration is not None:
+            self._motor.acceleration = acceleration
+
+    def pid(self, *args, **kwargs):
+        pass
+
+    def target_tolerances(self, *args, **kwargs):
+        pass
+
+    def stall_tolerances(self, *args, **kwargs):
+        pass
+
+
+class Motor:
+    def __init__(self, port, positive_direction=Direction.CLOCKWISE, gears=None):
+        self._world = evsim.world()
+        self._motor = self._world.attach_motor(port, positive_direction)
+        self._world.io("motor_init")
+        self.control = _Control(self._motor)
+
+    def _read(self):
+        self._world.io("motor_read")
+        return self._motor
+
+    def _write(self):
+        self._world.io("motor_write")
+        return self._motor
+
+    def _block(self, wait):
+        if wait:
+            motor = self._motor
+            self._world.wait_until(lambda: motor.done)
+
+    def speed(self):
+        return int(round(self._read().speed))
+
+    def angle(self):
+        return int(round(self._read().angle))
+
+    def reset_angle(self, angle=0):
+        motor = self._write()
+        if motor.mode == evsim.HOLD:
+            motor.hold_angle += angle - motor.angle
+        if motor.mode == evsim.TARGET:
+            motor.target_angle += angle - motor.angle
+        motor.angle = float(angle)
+
+    def stop(self):
+        self._write().command(evsim.COAST)
+
+    def brake(self):
+        self._write().command(evsim.BRAKE)
+
+    def hold(self):
+        self._write().command(evsim.HOLD)
+
+    def run(self, speed):
+        self._write().command(evsim.RUN, speed)
+
+    def dc(self, duty):
+        motor = self._write()
+        motor.command(evsim.RUN, motor.max_speed * max(-100, min(100, duty)) / 100)
+
+    def track_target(self, target_angle):
+        motor = self._write()
+        motor.command(evsim.TARGET, motor.max_speed, float(target_angle), Stop.HOLD)
+
+    def run_target(self, speed, target_angle, then=Stop.HOLD, wait=True):
+        self._write().command(evsim.TARGET, speed, float(target_angle), then)
+        self._block(wait)
+
+    def run_angle(self, speed, rotation_angle, then=Stop.HOLD, wait=True):
+        motor = self._write()
+        direction = -1 if (speed < 0) != (rotation_angle < 0) else 1
+        motor.command(evsim.TARGET, speed, motor.angle + direction * abs(rotation_angle), then)
+        self._block(wait)
+
+    def run_time(self, speed, time, then=Stop.HOLD, wait=True):
+        motor = self._write()
+        motor.command(evsim.RUN, speed)
+        end = self._world.now_us + time * 1000
+
+        def finished():
+            if self._world.now_us < end:
+                return False
+            if motor.mode == evsim.RUN:
+                motor.command(then)
+            return True
+
+        if wait:
+            self._world.wait_until(finished)
+        else:
+            self._world.schedule(end, finished)
+
+    def run_until_stalled(self, speed, then=Stop.COAST, duty_limit=None):
+        motor = self._write()
+        motor.command(evsim.RUN, speed)
+        self._world.wait_until(motor.stalled)
+        motor.command(then)
+        return int(round(motor.angle))
+
+
+class ColorSensor:
+    def __init__(self, port):
+        self._world = evsim.world()
+        self._world.sensor_position(port)
+        self._world.io("sensor_init")
+        self._port = port
+
+    def reflection(self):
+        self._world.io("sensor_read")
+        return self._world.reflection(self._port)
+
+    def ambient(self):
+        self._world.io("sensor_read")
+        return 5
+
+    def rgb(self):
+        self._world.io("sensor_read")
+        return self._world.rgb(self._port)
+
+    def color(self):
+        self._world.io("sensor_read")
+        return classify(*self._world.rgb(self._port))
+
+
+def classify(r, g, b):
+    """Maps a 0-100 (r, g, b) reading to the Color the EV3 firmware would most likely report."""
+    total = r + g + b
+    if total < 40:
+        return Color.BLACK
+    if min(r, g, b) > 55:
+        return Color.WHITE
+    high = max(r, g, b)
+    if high - min(r, g, b) < 12:
+        return Color.BLACK if total < 90 else Color.WHITE
+    if high == r:
+        if g > 0.7 * r:
+            return Color.YELLOW
+        return Color.BROWN if total < 80 else Color.RED
+    if high == g:
+        return Color.GREEN
+    return Color.BLUE
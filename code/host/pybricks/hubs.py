@@ -0,0 +1,59 @@
+"""Stand-in for `pybricks.hubs`."""
+
+import evsim
+
+
+class _Speaker:
+    def beep(self, frequency=500, duration=100):
+        evsim.world().advance(max(0, duration) * 1000)
+
+    def play_notes(self, notes, tempo=120):
+        evsim.world().advance(len(notes) * 60000000 // tempo)
+
+    def say(self, text):
+        pass
+
+    def set_volume(self, volume, which="_all_"):
+        pass
+
+
+class _Screen:
+    def clear(self):
+        pass
+
+    def print(self, *args, **kwargs):
+        pass
+
+    def draw_text(self, x, y, text, text_color=None, background_color=None):
+        pass
+
+
+class _Light:
+    def on(self, color):
+        pass
+
+    def off(self):
+        pass
+
+
+class _Buttons:
+    def pressed(self):
+        return []
+
+
+class _Battery:
+    def voltage(self):
+        return 8000
+
+    def current(self):
+        return 200
+
+
+class EV3Brick:
+    def __init__(self):
+        evsim.world().io("brick_init")
+        self.speaker = _Speaker()
+        self.screen = _Screen()
+        self.light = _Light()
+        self.buttons = _Buttons()
+        self.battery = _Battery()
@@ -0,0 +1,47 @@
+"""Stand-in for `pybricks.parameters`."""
+
+
+class _Constant:
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __repr__(self):
+        return "{}.{}".format(self.owner, self.name)
+
+    def __str__(self):
+        return self.name
+
+
+class Port:
+    A, B, C, D = "A", "B", "C", "D"
+    S1, S2, S3, S4 = "S1", "S2", "S3", "S4"
+
+
+class Direction:
+    CLOCKWISE = "CLOCKWISE"
+    COUNTERCLOCKWISE = "COUNTERCLOCKWISE"
+
+
+class Stop:
+    COAST = 0
+    BRAKE = 1
+    HOLD = 2
+
+
+class Color:
+    BLACK = _Constant("Color", "BLACK")
+    BLUE = _Constant("Color", "BLUE")
+    GREEN = _Constant("Color", "GREEN")
+    YELLOW = _Constant("Color", "YELLOW")
+    RED = _Constant("Color", "RED")
+    WHITE = _Constant("Color", "WHITE")
+    BROWN = _Constant("Color", "BROWN")
+
+
+class Button:
+    LEFT = _Constant("Button", "LEFT")
+    RIGHT = _Constant("Button", "RIGHT")
+    UP = _Constant("Button", "UP")
+    DOWN = _Constant("Button", "DOWN")
+    CENTER = _Constant("Button", "CENTER")
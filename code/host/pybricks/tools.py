@@ -0,0 +1,37 @@
+"""Stand-in for `pybricks.tools`. Time is virtual: `wait()` advances the simulation clock."""
+
+import evsim
+
+
+def wait(time):
+    """Advances the virtual clock by `time` milliseconds."""
+    if time > 0:
+        evsim.world().advance(time * 1000)
+
+
+class StopWatch:
+    """Millisecond stopwatch on the virtual clock."""
+
+    def __init__(self):
+        self._start = evsim.world().now_us
+        self._paused_at = None
+
+    def _now(self):
+        return evsim.world().now_us if self._paused_at is None else self._paused_at
+
+    def time(self):
+        return (self._now() - self._start) // 1000
+
+    def pause(self):
+        if self._paused_at is None:
+            self._paused_at = evsim.world().now_us
+
+    def resume(self):
+        if self._paused_at is not None:
+            self._start += evsim.world().now_us - self._paused_at
+            self._paused_at = None
+
+    def reset(self):
+        self._start = evsim.world().now_us
+        if self._paused_at is not None:
+            self._paused_at = self._start
@@ -0,0 +1,197 @@
+"""
+Feeds a recording made with `diagnostics.Recorder` back into Robot methods on the host.
+
+    python code/host/replay.py run.rec "line_trace_junction(1, 0.6)"
+    python code/host/replay.py run.rec "line_trace_junction(1, 0.6, polling_rate=5)" --robot "trace_speed=800, debug_mode=1"
+
+Each read of a sensor or encoder returns that device's next recorded value and moves the
+virtual clock up to the time it was recorded, and waits move the clock without sleeping. So
+a replay is deterministic and runs as fast as the host allows. The speeds the code commands
+with run() are compared with the recorded ones, which shows whether a change to the control
+code still does the same thing with the same inputs.
+
+Position moves (run_angle, run_target) run on the motors' own controllers on the brick and
+are ignored here, so recordings are of the closed-loop moves. The replay ends when the
+code asks a device for more readings than were recorded.
+"""
+
+import argparse
+import struct
+import sys
+from array import array
+
+import simulate  # noqa: F401  (puts the pybricks stand-in on sys.path)
+import evsim
+
+MAGIC = b"EVRC"
+HEADER = struct.Struct("<4sHIIH")
+CALLS = ("reflection", "angle", "speed", "run")
+DEVICE_NAMES = ("left_motor", "right_motor", "aux_motor_1", "aux_motor_2",
+                "left_sensor", "right_sensor", "aux_sensor_1", "aux_sensor_2")
+
+
+class ReplayEnd(Exception):
+    """Raised when the code reads past the end of a device's recording."""
+
+
+def load(path):
+    """Returns (names, dropped, rows) where rows is a list of (time_us, channel, value)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, count, dropped, names_length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("{} is not an evpylib recording.".format(path))
+    if version != 1:
+        raise ValueError("Unsupported recording version {}.".format(version))
+    offset = HEADER.size
+    names = data[offset:offset + names_length].decode().split(",") if names_length else []
+    offset += names_length
+    values = array("i")
+    values.frombytes(data[offset:offset + 12 * count])
+    if sys.byteorder != "little":
+        values.byteswap()
+    rows = [tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
+    return names, dropped, rows
+
+
+class Replay:
+    """
+    A loaded recording. devices() builds the replay devices for a Robot; they read and
+    advance the clock of the current `evsim` world, so call `evsim.reset()` first.
+
+    Parameters:
+    - path: str, recording written by Recorder.dump()
+    """
+
+    def __init__(self, path):
+        self.names, self.dropped, rows = load(path)
+        self.readings = {}  # channel -> [(time_us, value)]
+        self.recorded_runs = {}  # channel -> [speed]
+        for time_us, channel, value in rows:
+            if channel % 4 == 3:
+                self.recorded_runs.setdefault(channel, []).append(value)
+            else:
+                self.readings.setdefault(channel, []).append((time_us, value))
+        self.position = {channel: 0 for channel in self.readings}
+        self.runs = {}  # channel -> [speed] commanded during the replay
+        self.start_us = min((r[0][0] for r in self.readings.values()), default=0)
+
+    def rewind(self):
+        """
+        Moves the clock of the current world to the first recorded reading, so a call
+        replayed from a recording that starts mid-run sees the same elapsed times.
+        """
+        world = evsim.world()
+        if self.start_us > world.now_us:
+            world.advance(self.start_us - world.now_us)
+
+    def devices(self):
+        """Returns a Robot devices dict of replay devices, None for devices not recorded."""
+        devices = dict.fromkeys(DEVICE_NAMES)
+        for index, name in enumerate(self.names):
+            devices[name] = _ReplayDevice(self, 4 * index)
+        return devices
+
+    def read(self, channel):
+        readings = self.readings.get(channel)
+        i = self.position.get(channel, 0)
+        if readings is None or i >= len(readings):
+            name = self.names[channel // 4]
+            raise ReplayEnd("{}.{}() read past the end of the recording.".format(name, CALLS[channel % 4]))
+        self.position[channel] = i + 1
+        time_us, value = readings[i]
+        world = evsim.world()
+        if time_us > world.now_us:
+            world.advance(time_us - world.now_us)
+        return value
+
+    def consumed(self):
+        """Returns (readings used, readings recorded)."""
+        return sum(self.position.values()), sum(len(r) for r in self.readings.values())
+
+    def compare(self):
+        """
+        Compares the run() speeds commanded in the replay with the recorded ones.
+        Returns {device name: (replayed, recorded, first index that differs by more than 1
+        deg/s or None, largest difference)} over the commands both have.
+        """
+        report = {}
+        for channel in sorted(set(self.runs) | set(self.recorded_runs)):
+            replayed = self.runs.get(channel, [])
+            recorded = self.recorded_runs.get(channel, [])
+            first = None
+            largest = 0
+            for i, (a, b) in enumerate(zip(replayed, recorded)):
+                difference = abs(a - b)
+                if difference > 1 and first is None:
+                    first = i
+                if difference > largest:
+                    largest = difference
+            report[self.names[channel // 4]] = (len(replayed), len(recorded), first, largest)
+        return report
+
+
+class _ReplayDevice:
+    def __init__(self, replay, channel):
+        self._replay = replay
+        self._channel = channel
+
+    def reflection(self):
+        return self._replay.read(self._channel)
+
+    def angle(self):
+        return self._replay.read(self._channel + 1)
+
+    def speed(self):
+        return self._replay.read(self._channel + 2)
+
+    def run(self, speed):
+        self._replay.runs.setdefault(self._channel + 3, []).append(int(speed))
+
+    def reset_angle(self, angle=0):
+        pass
+
+    def stop(self):
+        pass
+
+    brake = hold = stop
+
+    def run_angle(self, speed, rotation_angle, then=None, wait=True):
+        pass
+
+    def run_target(self, speed, target_angle, then=None, wait=True):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording")
+    parser.add_argument("call", help='Robot method call to replay, e.g. "line_trace_junction(1, 0.6)"')
+    parser.add_argument("--robot", default="", help='Robot keyword arguments, e.g. "trace_speed=800"')
+    args = parser.parse_args(argv)
+
+    from evpylib import Robot
+
+    evsim.reset(io_latency=False)
+    replay = Replay(args.recording)
+    if replay.dropped:
+        print("Warning: the recording dropped {} records after its buffer filled.".format(replay.dropped))
+    robot = eval("Robot(devices, {})".format(args.robot), {"Robot": Robot, "devices": replay.devices()})
+    replay.rewind()
+    ended = None
+    try:
+        eval("robot." + args.call, {"robot": robot})
+    except ReplayEnd as e:
+        ended = e
+
+    used, total = replay.consumed()
+    print("Replayed {} of {} readings in {:.3f} s of recorded time{}".format(
+        used, total, evsim.world().now_us / 1e6, ", stopped: {}".format(ended) if ended else ""))
+    for name, (replayed, recorded, first, largest) in replay.compare().items():
+        verdict = "match" if first is None else "first differs at command {}".format(first)
+        print("{:12} {:6} commands, {:6} recorded, largest difference {:5.0f} deg/s, {}".format(
+            name, replayed, recorded, largest, verdict))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Runs a robot script against the simulated pybricks backend, faster than real time.
+
+    python code/host/simulate.py                   # main.py on the default mat
+    python code/host/simulate.py --track mat.ppm --start 150,300,0 --path path.csv
+
+The script runs unchanged: `code/host` is put first on `sys.path` so its `pybricks`
+package shadows the real one, and `code` is added so `from evpylib import Robot` works.
+"""
+
+import argparse
+import os
+import runpy
+import sys
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+CODE_DIR = os.path.dirname(HOST_DIR)
+
+
+def install():
+    """Puts the stand-in `pybricks` and the robot library on `sys.path`."""
+    for path in (CODE_DIR, HOST_DIR):
+        if path in sys.path:
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+
+
+install()
+
+import evsim  # noqa: E402
+
+
+def parse_start(text):
+    values = [float(v) for v in text.split(",")]
+    if len(values) != 3:
+        raise argparse.ArgumentTypeError("start must be x,y,heading")
+    return tuple(values)
+
+
+def run(script, world):
+    """
+    Runs `script` as `__main__` in `world` and returns (virtual_seconds, wall_seconds).
+    """
+    wall_start = time.perf_counter()
+    virtual_start = world.now_us
+    runpy.run_path(script, run_name="__main__")
+    return (world.now_us - virtual_start) / 1e6, time.perf_counter() - wall_start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("script", nargs="?", default=os.path.join(CODE_DIR, "main.py"))
+    parser.add_argument("--track", help="PPM/PGM track image, defaults to the built-in mat")
+    parser.add_argument("--mm-per-px", type=float, default=1.0)
+    parser.add_argument("--start", type=parse_start, default=(150.0, 300.0, 0.0),
+                        help="x,y,heading of the axle midpoint in mm and degrees")
+    parser.add_argument("--no-io-latency", action="store_true",
+                        help="do not charge virtual time for device reads and writes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="write the robot path to this CSV file")
+    parser.add_argument("--quiet", action="store_true", help="silence the script's print output")
+    args = parser.parse_args(argv)
+
+    track = evsim.Track.load(args.track, args.mm_per_px) if args.track else evsim.Track.default_mat()
+    world = evsim.reset(track=track, start=args.start, io_latency=not args.no_io_latency, seed=args.seed)
+    if args.path:
+        world.record_path()
+
+    stdout = sys.stdout
+    if args.quiet:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        virtual, wall = run(args.script, world)
+    finally:
+        if args.quiet:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print("Virtual time: {:.3f} s, wall time: {:.3f} s, {:.0f}x real time".format(
+        virtual, wall, virtual / wall if wall else float("inf")))
+    print("Final pose: x={:.1f} mm, y={:.1f} mm, heading={:.1f} deg, {} device calls".format(
+        world.x, world.y, evsim.math.degrees(world.heading), world.device_calls))
+
+    if args.path:
+        with open(args.path, "w") as f:
+            f.write("time_ms,x,y,heading\n")
+            for t, x, y, heading in world.path:
+                f.write("{:.0f},{:.1f},{:.1f},{:.1f}\n".format(t / 1000, x, y, heading))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Decodes telemetry files written by `diagnostics.Telemetry.dump()`.
+
+    python code/host/telemetry_decode.py run.bin              # CSV to stdout
+    python code/host/telemetry_decode.py run.bin -o run.csv
+
+From Python, load() returns the field names and rows, and load_numpy() returns a dict of
+NumPy arrays keyed by field name when NumPy is installed.
+"""
+
+import argparse
+import struct
+import sys
+from array import array
+
+MAGIC = b"EVTL"
+HEADER = struct.Struct("<4sHHIH")
+
+
+def load(path):
+    """Returns (fields, rows) where rows is a list of int tuples, oldest first."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, width, count, names_length = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("{} is not an evpylib telemetry file.".format(path))
+    if version != 1:
+        raise ValueError("Unsupported telemetry version {}.".format(version))
+    offset = HEADER.size
+    fields = tuple(data[offset:offset + names_length].decode().split(","))
+    offset += names_length
+    values = array("i")
+    values.frombytes(data[offset:offset + 4 * width * count])
+    if sys.byteorder != "little":
+        values.byteswap()
+    rows = [tuple(values[i:i + width]) for i in range(0, len(values), width)]
+    return fields, rows
+
+
+def load_numpy(path):
+    """Returns {field: numpy array}. Needs NumPy."""
+    import numpy as np
+    fields, rows = load(path)
+    table = np.array(rows, dtype=np.int32).reshape(-1, len(fields))
+    return {name: table[:, i] for i, name in enumerate(fields)}
+
+
+def write_csv(fields, rows, out):
+    out.write(",".join(fields) + "\n")
+    for row in rows:
+        out.write(",".join(str(v) for v in row) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode an evpylib telemetry file to CSV.")
+    parser.add_argument("path")
+    parser.add_argument("-o", "--output", help="CSV file to write, defaults to stdout")
+    args = parser.parse_args(argv)
+
+    fields, rows = load(args.path)
+    if args.output:
+        with open(args.output, "w") as out:
+            write_csv(fields, rows, out)
+    else:
+        write_csv(fields, rows, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
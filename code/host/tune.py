@@ -0,0 +1,350 @@
+"""
+Sweeps line-trace gains in the simulator and ranks them by lap time and cross-track error.
+
+    python code/host/tune.py                                   # random search on the oval
+    python code/host/tune.py --search grid --kp 0.4:1.2:5 --kd 0.2:1.0:5 --speed 600,800
+    python code/host/tune.py --search adaptive --samples 400 --track mat.ppm --start 150,300,0 --rotations 10
+    python code/host/tune.py --estimator lowpass:20 --noise 3 --speed 1000
+
+Every candidate drives the real `Robot.line_trace_rotations` control law in its own
+simulated world, so the result holds for `line_trace_time` and `line_trace_junction` too,
+which share it. Candidates run in a process pool across all cores. The swept parameters are
+Kp, Kd, trace speed, polling rate and TRACE_TARGET (which only matters for the one-sensor modes).
+--estimator picks the `control` rate estimator every candidate traces with, and --noise the
+standard deviation of the simulated sensor noise, to see how each copes with a noisy sensor.
+
+A candidate fails when the sensors stray more than --max-error mm from the line or the run
+times out. The rest are ranked by lap time + --error-weight * RMS cross-track error.
+"""
+
+import argparse
+import io
+import itertools
+import math
+import os
+import random
+import sys
+from array import array
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import simulate  # Also puts the pybricks stand-in on sys.path
+import evsim
+
+PARAMETERS = ("Kp", "Kd", "speed", "polling_rate", "target")
+DEFAULTS = {
+    "Kp": "0.5:6",
+    "Kd": "0:12",
+    "speed": "500:1000",
+    "polling_rate": "5,10",
+    "target": "50",
+}
+INTEGER = ("speed", "polling_rate", "target")
+
+
+def _chamfer(dist, width, height):
+    """Two-pass 3-4 chamfer transform in place: every non-zero cell gets 3x its distance to a zero cell."""
+    for y in range(height):
+        row = y * width
+        for x in range(width):
+            i = row + x
+            d = dist[i]
+            if d == 0:
+                continue
+            if x > 0 and dist[i - 1] + 3 < d: d = dist[i - 1] + 3
+            if y > 0:
+                up = i - width
+                if dist[up] + 3 < d: d = dist[up] + 3
+                if x > 0 and dist[up - 1] + 4 < d: d = dist[up - 1] + 4
+                if x < width - 1 and dist[up + 1] + 4 < d: d = dist[up + 1] + 4
+            dist[i] = d
+    for y in range(height - 1, -1, -1):
+        row = y * width
+        for x in range(width - 1, -1, -1):
+            i = row + x
+            d = dist[i]
+            if d == 0:
+                continue
+            if x < width - 1 and dist[i + 1] + 3 < d: d = dist[i + 1] + 3
+            if y < height - 1:
+                down = i + width
+                if dist[down] + 3 < d: d = dist[down] + 3
+                if x < width - 1 and dist[down + 1] + 4 < d: d = dist[down + 1] + 4
+                if x > 0 and dist[down - 1] + 4 < d: d = dist[down - 1] + 4
+            dist[i] = d
+    return dist
+
+
+def distance_map(track):
+    """
+    Returns an array holding, for every pixel, 3x its distance in pixels from the middle of
+    the nearest line. Off the line that is the distance to the line's edge plus half its
+    width; on the line, half its width less the distance to the edge.
+    """
+    width, height = track.width, track.height
+    refl = track.reflection_map()
+    far = 65535
+    outside = _chamfer(array("H", (0 if v < 128 else far for v in refl)), width, height)
+    inside = _chamfer(array("H", (far if v < 128 else 0 for v in refl)), width, height)
+    half = max(inside)
+    return array("H", (o + half if o else half - i for o, i in zip(outside, inside)))
+
+
+# Set in each worker by _init_worker, so the track and its distance map cross the process
+# boundary once rather than with every candidate
+_course = None
+
+
+def parse_estimator(text):
+    """
+    Parses "difference", "lowpass[:time_constant]" or "alphabeta[:alpha,beta]" into
+    (name, arguments), which make_estimator() builds in each worker.
+    """
+    name, _, arguments = text.partition(":")
+    if name not in ("difference", "lowpass", "alphabeta"):
+        raise argparse.ArgumentTypeError("unknown estimator {!r}".format(name))
+    return name, tuple(float(a) for a in arguments.split(",")) if arguments else ()
+
+
+def make_estimator(spec):
+    import control
+    name, arguments = spec
+    return {"difference": control.Difference, "lowpass": control.LowPass,
+            "alphabeta": control.AlphaBeta}[name](*arguments)
+
+
+def _init_worker(course):
+    global _course
+    _course = course
+
+
+def evaluate(candidate):
+    """
+    Drives one candidate over the course and returns a result dict with the candidate's
+    parameters, `lap_time` in s, `rms_error` and `max_error` in mm and `failed`.
+    """
+    from pybricks.ev3devices import Motor, ColorSensor
+    from pybricks.parameters import Port, Direction
+    from evpylib import Robot
+
+    course = _course
+    track, dist = course["track"], course["distance_map"]
+    layout = evsim.Layout()
+    if course["noise"] is not None:
+        layout.sensor_noise = course["noise"]
+    world = evsim.reset(track=track, start=course["start"], layout=layout, seed=course["seed"],
+                        time_limit=course["time_limit"])
+    world.record_path(interval_ms=20)
+    devices = {
+        "left_motor": Motor(Port.C, positive_direction=Direction.COUNTERCLOCKWISE),
+        "right_motor": Motor(Port.B, positive_direction=Direction.CLOCKWISE),
+        "aux_motor_1": None,
+        "aux_motor_2": None,
+        "left_sensor": ColorSensor(Port.S2),
+        "right_sensor": ColorSensor(Port.S1),
+        "aux_sensor_1": None,
+        "aux_sensor_2": None,
+    }
+    robot = Robot(devices, trace_speed=candidate["speed"])
+    begin = world.now_us  # Building the devices takes simulated time too
+
+    result = dict(candidate, lap_time=None, rms_error=None, max_error=None, failed=False)
+    try:
+        with redirect_stdout(io.StringIO()):
+            robot.line_trace_rotations(course["rotations"], candidate["Kp"], candidate["Kd"],
+                                       mode=course["mode"], polling_rate=candidate["polling_rate"],
+                                       TRACE_TARGET=candidate["target"],
+                                       estimator=make_estimator(course["estimator"]))
+    except evsim.SimulationTimeout:
+        result["failed"] = True
+    result["lap_time"] = (world.now_us - begin) / 1e6
+
+    # Cross-track error of the point between the line sensors
+    fx = sum(p[0] for p in course["sensors"]) / 2
+    fy = sum(p[1] for p in course["sensors"]) / 2
+    scale = 1.0 / track.mm_per_px
+    width, height = track.width, track.height
+    total = 0.0
+    worst = 0.0
+    for _, x, y, heading in world.path:
+        c, s = math.cos(math.radians(heading)), math.sin(math.radians(heading))
+        px = int((x + fx * c - fy * s) * scale)
+        py = height - 1 - int((y + fx * s + fy * c) * scale)
+        error = dist[py * width + px] * track.mm_per_px / 3 if 0 <= px < width and 0 <= py < height else 1e9
+        total += error * error
+        if error > worst: worst = error
+    samples = len(world.path) or 1
+    result["rms_error"] = math.sqrt(total / samples)
+    result["max_error"] = worst
+    if worst > course["max_error"]:
+        result["failed"] = True
+    return result
+
+
+def score(result, error_weight):
+    """Lower is better; failed runs sort last."""
+    if result["failed"]:
+        return float("inf")
+    return result["lap_time"] + error_weight * result["rms_error"]
+
+
+def parse_range(name, text):
+    """
+    Parses "lo:hi" (a range), "lo:hi:n" (n grid points) or "a,b,c" (a list of values).
+    Returns (low, high, points) where points is the grid, or None for a bare range.
+    """
+    cast = int if name in INTEGER else float
+    if ":" in text:
+        parts = text.split(":")
+        low, high = cast(parts[0]), cast(parts[1])
+        if len(parts) == 3:
+            n = int(parts[2])
+            points = [low + (high - low) * i / (n - 1) for i in range(n)] if n > 1 else [low]
+            return low, high, [cast(round(p, 6)) for p in points]
+        return low, high, None
+    points = [cast(v) for v in text.split(",")]
+    return min(points), max(points), points
+
+
+def grid_candidates(ranges, grid_points):
+    axes = []
+    for name in PARAMETERS:
+        low, high, points = ranges[name]
+        if points is None:
+            cast = int if name in INTEGER else float
+            n = grid_points
+            points = [cast(round(low + (high - low) * i / (n - 1), 6)) for i in range(n)] if n > 1 else [low]
+        axes.append(points)
+    return [dict(zip(PARAMETERS, values)) for values in itertools.product(*axes)]
+
+
+def random_candidate(ranges, rng, around=None, spread=1.0):
+    """
+    Draws one candidate uniformly from the ranges, or from a normal distribution of width
+    `spread` times the range around `around`, clipped to the ranges.
+    """
+    candidate = {}
+    for name in PARAMETERS:
+        low, high, points = ranges[name]
+        if points is not None and len(points) <= 3:
+            value = rng.choice(points) if around is None or rng.random() < spread else around[name]
+        elif around is None:
+            value = rng.uniform(low, high)
+        else:
+            value = min(high, max(low, rng.gauss(around[name], spread * (high - low) / 2)))
+        candidate[name] = int(round(value)) if name in INTEGER else round(value, 4)
+    return candidate
+
+
+def sweep(candidates, pool, chunksize=4):
+    return list(pool.imap_unordered(evaluate, candidates, chunksize))
+
+
+def adaptive_search(ranges, samples, pool, rng, error_weight, rounds=5, elite=8):
+    """
+    Spends exactly `samples` candidates in rounds: the first is uniform, each later one samples
+    around the best candidates so far with a narrowing spread. Every round draws at least
+    `elite` candidates, so with fewer than elite * rounds samples there are fewer rounds.
+    """
+    rounds = max(1, min(rounds, samples // elite))
+    per_round = samples // rounds
+    first = samples - per_round * (rounds - 1)  # The remainder goes to the uniform round
+    results = sweep([random_candidate(ranges, rng) for _ in range(first)], pool)
+    spread = 0.5
+    for _ in range(rounds - 1):
+        best = sorted(results, key=lambda r: score(r, error_weight))[:elite]
+        best = [r for r in best if not r["failed"]] or best
+        candidates = [random_candidate(ranges, rng, rng.choice(best), spread) for _ in range(per_round)]
+        results += sweep(candidates, pool)
+        spread *= 0.6
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--track", help="PPM/PGM track image, defaults to the built-in oval")
+    parser.add_argument("--mm-per-px", type=float, default=1.0)
+    parser.add_argument("--start", type=simulate.parse_start, help="x,y,heading, defaults to the oval's start")
+    parser.add_argument("--rotations", type=float,
+                        help="wheel rotations per lap, defaults to one lap of the oval")
+    parser.add_argument("--mode", default="balance")
+    parser.add_argument("--estimator", type=parse_estimator, default="difference",
+                        help="difference, lowpass[:time_constant] or alphabeta[:alpha,beta]")
+    parser.add_argument("--noise", type=float, help="sensor noise standard deviation, defaults to the layout's")
+    parser.add_argument("--search", choices=("grid", "random", "adaptive"), default="random")
+    parser.add_argument("--samples", type=int, default=200, help="candidates for random/adaptive search")
+    parser.add_argument("--grid-points", type=int, default=4, help="points per lo:hi range in a grid search")
+    for name in PARAMETERS:
+        parser.add_argument("--" + name.lower().replace("_", "-"), dest=name, default=DEFAULTS[name],
+                            help="lo:hi, lo:hi:n or a,b,c (default {})".format(DEFAULTS[name]))
+    parser.add_argument("--error-weight", type=float, default=0.05,
+                        help="seconds of lap time one mm of RMS cross-track error is worth")
+    parser.add_argument("--max-error", type=float, default=60.0, help="mm off the line that fails a run")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--csv", help="write every result to this CSV file")
+    args = parser.parse_args(argv)
+
+    if args.track:
+        if args.start is None or args.rotations is None:
+            parser.error("--track needs --start and --rotations")
+        track = evsim.Track.load(args.track, args.mm_per_px)
+        start, rotations = args.start, args.rotations
+    else:
+        straight, radius = 1200, 300
+        track = evsim.Track.oval(straight, radius)
+        start = args.start or (radius + 200, 200, 0)
+        lap = 2 * straight + 2 * math.pi * radius
+        rotations = args.rotations or lap / (math.pi * evsim.Layout().wheel_diameter)
+
+    ranges = {name: parse_range(name, getattr(args, name)) for name in PARAMETERS}
+    layout = evsim.Layout()
+    print("Building the distance map...", file=sys.stderr)
+    course = {
+        "track": track,
+        "distance_map": distance_map(track),
+        "start": start,
+        "rotations": rotations,
+        "mode": args.mode,
+        "estimator": args.estimator,
+        "noise": args.noise,
+        "seed": args.seed,
+        "sensors": (layout.sensor_ports["S1"], layout.sensor_ports["S2"]),
+        "max_error": args.max_error,
+        # Generous: a lap at 200 deg/s
+        "time_limit": rotations * 360 / 200,
+    }
+
+    rng = random.Random(args.seed)
+    with Pool(args.workers, initializer=_init_worker, initargs=(course,)) as pool:
+        if args.search == "grid":
+            candidates = grid_candidates(ranges, args.grid_points)
+            print("Running {} candidates on {} workers...".format(len(candidates), args.workers), file=sys.stderr)
+            results = sweep(candidates, pool)
+        elif args.search == "random":
+            print("Running {} candidates on {} workers...".format(args.samples, args.workers), file=sys.stderr)
+            results = sweep([random_candidate(ranges, rng) for _ in range(args.samples)], pool)
+        else:
+            print("Running {} candidates on {} workers...".format(args.samples, args.workers), file=sys.stderr)
+            results = adaptive_search(ranges, args.samples, pool, rng, args.error_weight)
+
+    results.sort(key=lambda r: score(r, args.error_weight))
+    columns = PARAMETERS + ("lap_time", "rms_error", "max_error", "failed")
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write(",".join(columns) + "\n")
+            for r in results:
+                f.write(",".join(str(r[c]) for c in columns) + "\n")
+
+    failed = sum(1 for r in results if r["failed"])
+    print("{} candidates, {} failed. Best:".format(len(results), failed))
+    print("{:>6} {:>6} {:>6} {:>5} {:>6} {:>8} {:>8} {:>8}".format(
+        "Kp", "Kd", "speed", "rate", "target", "lap s", "rms mm", "max mm"))
+    for r in results[:args.top]:
+        print("{Kp:6.3f} {Kd:6.3f} {speed:6d} {polling_rate:5d} {target:6d} {lap_time:8.2f} {rms_error:8.1f} "
+              "{max_error:8.1f}{flag}".format(flag="  failed" if r["failed"] else "", **r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Stand-in for MicroPython's `utime` on the virtual clock, so microsecond timing in
+`evpylib` measures simulated time rather than host time.
+"""
+
+import evsim
+
+
+def ticks_us():
+    return evsim.world().now_us
+
+
+def ticks_ms():
+    return evsim.world().now_us // 1000
+
+
+def ticks_diff(end, start):
+    return end - start
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def sleep_us(us):
+    if us > 0:
+        evsim.world().advance(us)
+
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+
+def sleep(seconds):
+    sleep_us(int(seconds * 1000000))
+
+
+def time():
+    return evsim.world().now_us // 1000000
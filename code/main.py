@@ -3,30 +3,38 @@ from pybricks.hubs import EV3Brick
 from pybricks.ev3devices import (Motor, ColorSensor)
 from pybricks.parameters import Port, Stop, Direction
 from pybricks.tools import wait, StopWatch
-from evpylib import Robot
+from evpylib import Robot, Lazy
 
 devices = {
     "left_motor": Motor(Port.C, positive_direction=Direction.COUNTERCLOCKWISE),
     "right_motor": Motor(Port.B, positive_direction=Direction.CLOCKWISE),
-    "aux_motor_1": Motor(Port.D, positive_direction=Direction.CLOCKWISE),
-    "aux_motor_2": Motor(Port.A, positive_direction=Direction.CLOCKWISE),
+    "aux_motor_1": Lazy(Motor, Port.D, positive_direction=Direction.CLOCKWISE),
+    "aux_motor_2": Lazy(Motor, Port.A, positive_direction=Direction.CLOCKWISE),
     "left_sensor": ColorSensor(Port.S2),
     "right_sensor": ColorSensor(Port.S1),
-    "aux_sensor_1": ColorSensor(Port.S3),
-    "aux_sensor_2": ColorSensor(Port.S4),
+    "aux_sensor_1": Lazy(ColorSensor, Port.S3),
+    "aux_sensor_2": Lazy(ColorSensor, Port.S4),
 }
 
+robot = None  # Shared by every routine, built by get_robot()
+
+def get_robot():
+    global robot
+    if robot is None:
+        robot = Robot(
+            devices = devices,
+            base_speed=1000,
+            trace_speed=800,
+            max_speed=1200,
+            aux_speed=100,
+            turning_const=2.760,
+            debug_mode=1,
+        )
+    return robot
+
 def safe_routine():
 
-    robot = Robot(
-        devices = devices,
-        base_speed=1000,
-        trace_speed=800,
-        max_speed=1200,
-        aux_speed=100,
-        turning_const=2.760,
-        debug_mode=1,
-    )
+    robot = get_robot()
 
     robot.ev3.speaker.beep(frequency=1000, duration=300)
     robot.move_rotations(0.5)
@@ -37,15 +45,7 @@ def safe_routine():
 
 def normal_routine():
 
-    robot = Robot(
-        devices = devices,
-        base_speed=1000,
-        trace_speed=800,
-        max_speed=1200,
-        aux_speed=100,
-        turning_const=2.760,
-        debug_mode=1,
-    )
+    robot = get_robot()
 
     robot.ev3.speaker.beep(frequency=1000, duration=200)
 
@@ -57,15 +57,8 @@ def normal_routine():
     robot.move_rotations(0.5)
 
 def test():
-    robot = Robot(
-        devices = devices,
-        base_speed=1000,
-        trace_speed=800,
-        max_speed=1200,
-        aux_speed=100,
-        turning_const=2.760,
-        debug_mode=1,
-    )
+    robot = get_robot()
     robot.ev3.speaker.beep(frequency=1000, duration=300)
 
-normal_routine()
\ No newline at end of file
+if __name__ == "__main__":
+    normal_routine()
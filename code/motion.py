@@ -0,0 +1,133 @@
+"""
+Velocity profiles for the drive motors.
+
+A profile is computed once when a move starts; sampling it each tick is a handful of
+multiplications. Speeds are in deg/s, distances in degrees and times in seconds.
+With `jerk=None` the speed changes are linear ramps (trapezoidal profile); with a jerk
+limit they are S-curves, which are gentler on the tyres at the same acceleration.
+"""
+
+from math import sqrt
+
+
+class Ramp:
+    """
+    A speed change from v0 to v1 under acceleration and optional jerk limits.
+
+    Parameters:
+    - v0, v1: float, start and end speed in deg/s
+    - acceleration: float, deg/s^2
+    - jerk: float, deg/s^3, or None for a linear ramp
+    """
+
+    def __init__(self, v0, v1, acceleration, jerk=None):
+        self.v0 = v0
+        self.v1 = v1
+        dv = abs(v1 - v0)
+        self.sign = 1 if v1 >= v0 else -1
+        if jerk is None or dv == 0:
+            self.jerk = None
+            self.accel = acceleration
+            self.t_jerk = 0.0
+            self.t_const = dv / acceleration
+        else:
+            self.jerk = jerk
+            # Acceleration never reaches its limit on small speed changes
+            self.accel = min(acceleration, sqrt(dv * jerk))
+            self.t_jerk = self.accel / jerk
+            self.t_const = dv / self.accel - self.t_jerk
+        self.duration = 2 * self.t_jerk + self.t_const
+        # A symmetric ramp averages the two speeds, so its length is simple
+        self.distance = (v0 + v1) / 2 * self.duration
+
+    def sample(self, t):
+        """Returns (distance, speed) t seconds into the ramp."""
+        if t <= 0:
+            return 0.0, self.v0
+        if t >= self.duration:
+            return self.distance + self.v1 * (t - self.duration), self.v1
+        s, v0, a = self.sign, self.v0, self.accel
+        if self.jerk is None:
+            return v0 * t + s * a * t * t / 2, v0 + s * a * t
+        j, tj, tc = self.jerk, self.t_jerk, self.t_const
+        if t < tj:
+            return v0 * t + s * j * t * t * t / 6, v0 + s * j * t * t / 2
+        x1 = v0 * tj + s * j * tj * tj * tj / 6
+        va = v0 + s * a * tj / 2
+        u = t - tj
+        if u < tc:
+            return x1 + va * u + s * a * u * u / 2, va + s * a * u
+        x2 = x1 + va * tc + s * a * tc * tc / 2
+        vb = va + s * a * tc
+        u -= tc
+        return x2 + vb * u + s * (a * u * u / 2 - j * u * u * u / 6), vb + s * (a * u - j * u * u / 2)
+
+
+class MotionProfile:
+    """
+    Time-optimal move over `distance` degrees: ramp up, cruise, ramp down.
+
+    The cruise speed is the highest that still leaves room to ramp down to end_speed.
+    If even ramping straight from start_speed to end_speed needs more than `distance`,
+    the profile is marked `feasible = False` and stops at `distance` before end_speed.
+    A move that starts or ends faster than max_speed ramps to max_speed and cruises there,
+    as the inner wheel of an arc entered at speed does.
+
+    Parameters:
+    - distance: float, degrees to travel, >= 0
+    - max_speed: float, cruise speed limit in deg/s
+    - acceleration: float, deg/s^2
+    - jerk: float, deg/s^3, or None for a trapezoidal profile
+    - start_speed, end_speed: float, deg/s at the start and end of the move
+    """
+
+    def __init__(self, distance, max_speed, acceleration, jerk=None, start_speed=0.0, end_speed=0.0):
+        self.distance = distance
+        self.feasible = True
+        floor = max(start_speed, end_speed)
+        peak = max_speed
+
+        def ramps(vp):
+            return Ramp(start_speed, vp, acceleration, jerk), Ramp(vp, end_speed, acceleration, jerk)
+
+        up, down = ramps(peak)
+        if max_speed < floor:
+            # A lower peak only needs more room and a higher one passes max_speed
+            if up.distance + down.distance > distance:
+                self.feasible = False
+        elif up.distance + down.distance > distance:
+            # Not enough room to reach max_speed: bisect for the highest reachable peak
+            low, high = floor, peak
+            up, down = ramps(low)
+            if up.distance + down.distance > distance:
+                self.feasible = False
+            else:
+                for _ in range(24):
+                    mid = (low + high) / 2
+                    up, down = ramps(mid)
+                    if up.distance + down.distance > distance:
+                        high = mid
+                    else:
+                        low = mid
+                up, down = ramps(low)
+        self.up = up
+        self.down = down
+        self.peak = up.v1
+        cruise = distance - up.distance - down.distance
+        self.t_cruise = cruise / self.peak if cruise > 0 and self.peak > 0 else 0.0
+        self.t_down = up.duration + self.t_cruise
+        self.duration = self.t_down + down.duration
+        self.end_speed = end_speed
+
+    def sample(self, t):
+        """Returns (position, speed) t seconds into the move. Position never passes `distance`."""
+        if t < self.up.duration:
+            x, v = self.up.sample(t)
+            return (x, v) if x < self.distance else (self.distance, v)
+        if t < self.t_down:
+            return self.up.distance + self.peak * (t - self.up.duration), self.peak
+        if t < self.duration:
+            x, v = self.down.sample(t - self.t_down)
+            x += self.distance - self.down.distance
+            return (x, v) if x < self.distance else (self.distance, v)
+        return self.distance, self.end_speed
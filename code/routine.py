@@ -0,0 +1,288 @@
+"""
+Routines: Robot moves chained back to back without stopping in between.
+
+    routine = Routine(robot)
+    routine.move(0.5).trace_junction(1, 0.6, rotations=2).turn(-95).trace_time(1000, 1, 0.3).move(0.5)
+    routine.print_estimate()
+    routine.run()
+
+At each boundary the robot hands its speed over to the next step (then="CONTINUE") instead
+of stopping. The handoff is the highest speed both steps allow, so a profiled move only
+slows down as far as the next step needs. Traces hand over at trace speed; straight moves
+and arcs that drive both wheels forward hand over at their cruise speed, and only when the
+robot has an acceleration limit. The handoff is the outer wheel's speed: an arc hands its
+inner wheel over slower, and each wheel of the next step starts from its own speed and
+changes it within the acceleration limit. In-place turns and reversing always start and
+end at rest.
+A step given its own `then` stops there as usual.
+
+Auxiliary motor steps start in the background and take no time of their own: the arm moves
+while the drive steps after them run, until a join() step waits for it. Blends carry on
+past auxiliary steps but not past a join, where the robot stops.
+"""
+
+from math import sqrt
+
+from motion import MotionProfile
+
+
+class _Step:
+    def __init__(self, kind, args, options, then, rotations=None):
+        self.kind = kind
+        self.args = args
+        self.options = options
+        self.then = then
+        self.rotations = rotations  # Expected distance of a junction trace, for the estimator
+
+
+# Robot method run by each kind of step
+_METHODS = {
+    "move": "move_rotations",
+    "turn": "turn_arc",
+    "trace_time": "line_trace_time",
+    "trace_rotations": "line_trace_rotations",
+    "trace_junction": "line_trace_junction",
+    "aux_angle": "move_aux_angle",
+    "aux_stall": "move_aux_stall",
+    "join": "join",
+}
+
+
+class Routine:
+    """
+    A list of steps for one Robot, built by chaining the methods below and run with run().
+
+    Parameters:
+    - robot: Robot, the robot to drive
+    """
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.steps = []
+
+    def _add(self, kind, args, options, then, rotations=None):
+        self.steps.append(_Step(kind, args, options, then, rotations))
+        return self
+
+    def move(self, rotations, speed=None, then=None):
+        """
+        Adds a Robot.move_rotations step.
+
+        Parameters:
+        - rotations: float, wheel rotations, negative for backwards
+        - speed: int, optional cruise speed in deg/s
+        - then: optional stop action, which ends the blend at this step
+        """
+        return self._add("move", (rotations,), {"speed": speed}, then)
+
+    def turn(self, angle, radius_factor=0.0, then=None):
+        """
+        Adds a Robot.turn_arc step.
+
+        Parameters:
+        - angle: float, degrees, positive for right
+        - radius_factor: float, 0 for an in-place turn, higher for a wider arc
+        - then: optional stop action, which ends the blend at this step
+        """
+        return self._add("turn", (angle, radius_factor), {}, then)
+
+    def trace_time(self, duration, Kp, Kd, then=None, **options):
+        """
+        Adds a Robot.line_trace_time step. Extra keyword arguments go to line_trace_time.
+        """
+        return self._add("trace_time", (duration, Kp, Kd), options, then)
+
+    def trace_rotations(self, rotations, Kp, Kd, then=None, **options):
+        """
+        Adds a Robot.line_trace_rotations step. Extra keyword arguments go to line_trace_rotations.
+        """
+        return self._add("trace_rotations", (rotations, Kp, Kd), options, then, rotations)
+
+    def trace_junction(self, Kp, Kd, junction_count=1, rotations=None, then=None, **options):
+        """
+        Adds a Robot.line_trace_junction step. Extra keyword arguments go to line_trace_junction.
+
+        Parameters:
+        - rotations: float, expected wheel rotations to where the step stops. Only used by
+          the estimator, which cannot time the step without it.
+        """
+        return self._add("trace_junction", (Kp, Kd, junction_count), options, then, rotations)
+
+    def aux_angle(self, angle, motor_number):
+        """
+        Adds a Robot.move_aux_angle step that runs in the background until the next join().
+        """
+        return self._add("aux_angle", (angle, motor_number), {"background": True}, None)
+
+    def aux_stall(self, motor_number, reversed=False, **options):
+        """
+        Adds a Robot.move_aux_stall step that runs in the background until the next join().
+        Extra keyword arguments go to move_aux_stall.
+        """
+        options["background"] = True
+        return self._add("aux_stall", (motor_number, reversed), options, None)
+
+    def join(self):
+        """Adds a step that stops and waits for every auxiliary move started before it."""
+        return self._add("join", (), {}, None)
+
+    def _wheel_scales(self, step):
+        """Returns (left_scale, right_scale) of a move or turn, the faster wheel at +-1."""
+        robot = self.robot
+        if step.kind == "move":
+            speed = step.options["speed"]
+            direction = -1 if ((speed or 1) < 0) != (step.args[0] < 0) else 1
+            return direction, direction
+        angle, radius_factor = step.args
+        left = angle * robot.TURN_CONST + radius_factor
+        right = -angle * robot.TURN_CONST + radius_factor
+        lead = max(abs(left), abs(right)) or 1
+        return left / lead, right / lead
+
+    def _blend_limit(self, step):
+        """Highest speed in deg/s this step can start or end at without stopping."""
+        robot = self.robot
+        if step.kind.startswith("trace"):
+            return robot.TRACE_SPEED
+        if not robot.ACCELERATION:
+            return 0
+        left_scale, right_scale = self._wheel_scales(step)
+        if left_scale <= 0 or right_scale <= 0:
+            return 0
+        speed = step.options.get("speed")
+        return robot._cruise_speed(abs(speed) if speed else robot.MAX_SPEED)
+
+    def _distance(self, step):
+        """Wheel degrees the faster wheel of a move or turn travels."""
+        if step.kind == "move":
+            return abs(step.args[0]) * 360
+        angle, radius_factor = step.args
+        turn = angle * self.robot.TURN_CONST
+        return max(abs(turn + radius_factor), abs(-turn + radius_factor))
+
+    def _entry_limit(self, step, exit):
+        """
+        Highest speed this step can be entered at, given that it hands over at `exit`. Both
+        wheels enter at up to that speed, and in an arc the slower wheel has to brake to its
+        share of the speed within its own distance, at the robot's acceleration limit.
+        """
+        limit = self._blend_limit(step)
+        if step.kind != "turn" or not limit:
+            return limit
+        inner = min(self._wheel_scales(step))
+        share = inner * exit
+        return min(limit, sqrt(share * share + 2 * self.robot.ACCELERATION * inner * self._distance(step)))
+
+    def _handoffs(self, blended=True):
+        """
+        Returns the speed each drive step hands over to the next drive step, 0 where the robot
+        stops. Auxiliary and join steps get 0. Worked out from the last step back, since
+        how fast an arc can be entered depends on how fast it is left.
+        """
+        steps = self.steps
+        handoffs = [0] * len(steps)
+        for i in range(len(steps) - 1, -1, -1):
+            step = steps[i]
+            if not blended or step.then is not None or step.kind.startswith("aux") or step.kind == "join":
+                continue
+            for j in range(i + 1, len(steps)):
+                later = steps[j]
+                if not later.kind.startswith("aux"):
+                    if later.kind != "join":
+                        handoffs[i] = min(self._blend_limit(step), self._entry_limit(later, handoffs[j]))
+                    break
+        return handoffs
+
+    def run(self):
+        """Runs the steps in order, blending each into the next."""
+        robot = self.robot
+        for step, handoff in zip(self.steps, self._handoffs()):
+            method = getattr(robot, _METHODS[step.kind])
+            if step.kind.startswith("aux") or step.kind == "join":
+                method(*step.args, **step.options)
+                continue
+            then = step.then
+            if then is None:
+                then = "CONTINUE" if handoff else "HOLD"
+            options = dict(step.options)
+            if step.kind in ("move", "turn"):
+                options["exit_speed"] = handoff
+            method(*step.args, then=then, **options)
+
+    def _step_time(self, step, entry, exit):
+        """Predicted seconds for one step entered at `entry` and left at `exit` deg/s, or None."""
+        robot = self.robot
+        if step.kind == "trace_time":
+            return step.args[0] / 1000
+        if step.kind.startswith("trace"):
+            if step.rotations is None:
+                return None
+            # Linear ease from the entry speed to trace speed, then trace speed to the end
+            distance = abs(step.rotations) * 360
+            speed = robot.TRACE_SPEED
+            entry = min(entry, speed)
+            ease = step.options.get("ease_duration", 400) / 1000
+            ease_distance = (entry + speed) / 2 * ease
+            if distance >= ease_distance:
+                return ease + (distance - ease_distance) / speed
+            slope = (speed - entry) / ease
+            return (-entry + (entry * entry + 2 * slope * distance) ** 0.5) / slope
+
+        left_scale, right_scale = self._wheel_scales(step)
+        distance = self._distance(step)
+        speed = step.options.get("speed")
+        if not robot.ACCELERATION:
+            return distance / abs(speed or robot.BASE_SPEED)
+        cruise = robot._cruise_speed(abs(speed) if speed else robot.MAX_SPEED)
+        if left_scale <= 0 or right_scale <= 0:
+            entry = 0
+        return MotionProfile(distance, cruise, robot.ACCELERATION, robot.JERK,
+                             min(entry, cruise), min(exit, cruise)).duration
+
+    def estimate(self, blended=True):
+        """
+        Predicts how long the routine takes without running it.
+
+        Returns (total_seconds, step_seconds). Steps that cannot be timed, such as junction
+        traces without an expected distance, are None in step_seconds and left out of the total.
+        Auxiliary steps take no time; a join takes whatever is left of the auxiliary moves
+        before it, and cannot be timed after a move_aux_stall.
+
+        Parameters:
+        - blended: bool, False to time the same steps with a stop at every boundary
+        """
+        entry = 0
+        now = 0
+        aux_done = 0  # When the background moves started so far finish, None if unknown
+        times = []
+        for step, handoff in zip(self.steps, self._handoffs(blended)):
+            if step.kind == "aux_angle":
+                if aux_done is not None:
+                    aux_done = max(aux_done, now + abs(step.args[0]) / self.robot.AUX_SPEED)
+                t = 0
+            elif step.kind == "aux_stall":
+                aux_done = None
+                t = 0
+            elif step.kind == "join":
+                t = None if aux_done is None else max(0, aux_done - now)
+                aux_done = 0
+                entry = 0
+            else:
+                t = self._step_time(step, entry, handoff)
+                entry = handoff
+            times.append(t)
+            if t is not None:
+                now += t
+        return sum(t for t in times if t is not None), times
+
+    def print_estimate(self):
+        """Prints the blended and stop-and-go estimates step by step."""
+        total, times = self.estimate()
+        stop_total, stop_times = self.estimate(blended=False)
+        for step, handoff, t, stop_t in zip(self.steps, self._handoffs(), times, stop_times):
+            if t is None:
+                print("{:16} unknown".format(step.kind))
+            else:
+                print("{:16} {:6.2f} s ({:6.2f} s stopping), hands over at {:4.0f} deg/s".format(
+                    step.kind, t, stop_t, handoff))
+        print("Total {:.2f} s, {:.2f} s with stops".format(total, stop_total))
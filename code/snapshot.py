@@ -0,0 +1,89 @@
+"""
+Drive encoder readings shared within a control-loop tick.
+
+Robot builds a DeviceSnapshot the first time a loop has more than one part reading the
+encoders, such as the odometry or bump_align's stall detectors, and not at all otherwise.
+"""
+
+from array import array
+
+
+class DeviceSnapshot:
+    """
+    The drive encoder readings of the current control-loop tick, for loops where more than one
+    part needs them (the step, the odometry, stall detectors), so they share one device read
+    instead of each going through sysfs.
+
+    The readings live in a preallocated array with a bit per encoder saying whether it has
+    been read this tick. The first read of a tick goes to the device; later ones return the
+    stored value and count a read saved. Only a loop's ticks keep readings: the loop calls
+    next_tick() at the top of every tick and end() when it finishes, and outside a tick every
+    read goes to the device, so nothing read between moves is ever stale. Anything that moves
+    the encoders within a tick calls invalidate(). `left` and `right` are the drive motors
+    with angle() served from the snapshot, for code that takes a motor, such as StallDetector.
+    Loops that read each encoder once read the motors directly and leave the snapshot out.
+    """
+
+    def __init__(self, left_motor, right_motor):
+        self.values = array("l", [0, 0])
+        self.fresh = 0  # Bit per encoder read this tick
+        self.keep = 0  # Bits the current tick keeps, 0 outside a tick
+        self.wanted = False  # Set when a step reads through the snapshot, so its loop ticks it
+        self.ticks = 0
+        self.reads = 0
+        self.saved = 0
+        self._read_left = left_motor.angle
+        self._read_right = right_motor.angle
+        self.left = _SnapshotMotor(left_motor, self.left_angle)
+        self.right = _SnapshotMotor(right_motor, self.right_angle)
+
+    def next_tick(self):
+        """Starts a new tick: each encoder is read afresh on its next use and then kept."""
+        self.fresh = 0
+        self.keep = 3
+        self.ticks += 1
+
+    def end(self):
+        """Ends the last tick; reads go straight to the devices until the next one."""
+        self.fresh = 0
+        self.keep = 0
+        self.wanted = False
+
+    def invalidate(self):
+        """Forgets the readings of this tick without starting a new one."""
+        self.fresh = 0
+
+    def saved_per_tick(self):
+        """Returns the device reads saved per tick since the snapshot was built."""
+        return self.saved / self.ticks if self.ticks else 0
+
+    def left_angle(self):
+        if self.fresh & 1:
+            self.saved += 1
+            return self.values[0]
+        value = self._read_left()
+        self.values[0] = value
+        self.fresh |= self.keep & 1
+        self.reads += 1
+        return value
+
+    def right_angle(self):
+        if self.fresh & 2:
+            self.saved += 1
+            return self.values[1]
+        value = self._read_right()
+        self.values[1] = value
+        self.fresh |= self.keep & 2
+        self.reads += 1
+        return value
+
+
+class _SnapshotMotor:
+    """A drive motor whose angle() comes from a DeviceSnapshot."""
+
+    def __init__(self, motor, angle):
+        self._motor = motor
+        self.angle = angle
+
+    def __getattr__(self, name):
+        return getattr(self._motor, name)
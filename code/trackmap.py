@@ -0,0 +1,187 @@
+"""
+Maps of known line routes, for curvature feedforward and speed plans in the line traces.
+"""
+
+from array import array
+import struct
+from math import sqrt
+
+
+class TrackMap:
+    """
+    The curves and junctions of a line route, learnt on a slow mapping pass and used on later
+    runs of the same route to steer into curves ahead of the sensors and to set the speed.
+
+    Distance is measured in wheel degrees, the mean of both encoders, from where each trace
+    starts, in bins of bin_size degrees. Give a new map to a line trace as `track_map` and
+    that trace is the mapping pass: every tick adds the turn it needed per deg/s of speed,
+    the curvature, to its bin, and line_trace_junction adds the junctions it finds. plan()
+    then averages the bins, smooths them and works out a speed for each: sprint_speed on
+    straights, curve_speed in the sharpest curve and more in gentler ones, as for a constant
+    sideways acceleration, and junction_speed up to each junction so it is still seen. The
+    speeds are then limited so the robot can brake and accelerate between them. From then on
+    a trace given the map drives the planned speed and adds the curvature of the bin `lead`
+    degrees ahead as feedforward turn, so the PD loop only corrects what the map gets wrong.
+
+    The route has to start from the same place every run, at a repeatable handoff, and the
+    gains have to hold up at sprint_speed. The arrays are preallocated; a tick allocates
+    nothing. save() and load() keep a planned map between runs.
+
+        track = TrackMap(length=3000)
+        robot.line_trace_junction(2, 1.5, track_map=track)  # Mapping pass at trace speed
+        track.plan(sprint_speed=1100, curve_speed=600)
+        track.save("track.map")
+        ...
+        robot.line_trace_junction(2, 1.5, track_map=TrackMap.load("track.map"))
+
+    Parameters:
+    - length: int, longest route in wheel degrees
+    - bin_size: int, wheel degrees per bin
+    """
+
+    MAGIC = b"EVTM"
+    VERSION = 1
+
+    def __init__(self, length=10000, bin_size=16):
+        self.bin_size = bin_size
+        self.bins = length // bin_size + 1
+        self.curvature = array("h", [0] * self.bins)  # Turn per deg/s of speed, scaled by 1024
+        self.speeds = None
+        self.junctions = []  # Bins a junction was found in
+        self.lead_bins = 0
+        self.origin = 0
+        self._sums = array("l", [0] * self.bins)
+        self._counts = array("H", [0] * self.bins)
+        self.recording = True
+
+    def clear(self):
+        """Forgets the route and starts recording again."""
+        self.__init__(self.bins * self.bin_size, self.bin_size)
+
+    def begin(self, position):
+        """Sets the start of the route. Called by the trace with the sum of both encoders."""
+        self.origin = position
+
+    def index(self, position):
+        """Returns the bin of a position given as the sum of both encoders."""
+        i = (position - self.origin) // (2 * self.bin_size)
+        if i < 0: return 0
+        if i >= self.bins: return self.bins - 1
+        return i
+
+    def record(self, index, turn, speed):
+        """Adds the turn in deg/s the trace commanded at `speed` in bin `index`."""
+        if speed > 0:
+            self._sums[index] += (turn << 10) // speed
+            self._counts[index] += 1
+
+    def mark_junction(self, position):
+        """Records a junction at a position given as the sum of both encoders."""
+        self.junctions.append(self.index(position))
+
+    def plan(self, sprint_speed, curve_speed, junction_speed=None, acceleration=3000,
+             lead=32, smoothing=2, straight=0.05, junction_window=150):
+        """
+        Turns the recorded bins into the curvature and speed tables and ends recording.
+
+        Parameters:
+        - sprint_speed: int, deg/s on straights
+        - curve_speed: int, deg/s in the sharpest curve
+        - junction_speed: int, deg/s approaching a junction, defaults to curve_speed
+        - acceleration: int, deg/s² the robot may speed up or brake at
+        - lead: int, wheel degrees ahead that the feedforward is looked up
+        - smoothing: int, bins either side averaged into each bin
+        - straight: float, curvature (turn per speed) under which a bin counts as straight
+        - junction_window: int, wheel degrees before a junction driven at junction_speed
+        """
+        if not self.recording:
+            raise ValueError("TrackMap is already planned; clear() it to map again.")
+        if junction_speed is None: junction_speed = curve_speed
+        bins = self.bins
+        sums = self._sums
+        counts = self._counts
+        end = 0
+        for i in range(bins):
+            if counts[i]: end = i + 1
+        if not end:
+            raise ValueError("TrackMap has nothing recorded.")
+
+        # Mean per bin, carrying the previous bin over any the mapping pass skipped
+        mean = [0] * end
+        previous = 0
+        for i in range(end):
+            if counts[i]: previous = sums[i] // counts[i]
+            mean[i] = previous
+        curvature = self.curvature
+        for i in range(bins):
+            if i >= end:
+                curvature[i] = 0
+                continue
+            low = max(i - smoothing, 0)
+            high = min(i + smoothing + 1, end)
+            curvature[i] = sum(mean[low:high]) // (high - low)
+
+        # Speed for a constant sideways acceleration, which goes with speed² times curvature
+        threshold = int(straight * 1024)
+        peak = max(max(abs(curvature[i]) for i in range(end)), 1)
+        speeds = [0] * bins
+        for i in range(bins):
+            bend = abs(curvature[i])
+            if i >= end:
+                speed = curve_speed  # Past the mapped route: be careful
+            elif bend <= threshold:
+                speed = sprint_speed
+            else:
+                speed = min(sprint_speed, curve_speed * sqrt(peak / bend))
+            speeds[i] = speed
+        window = max(junction_window // self.bin_size, 1)
+        for junction in self.junctions:
+            for i in range(max(junction - window, 0), min(junction + 2, bins)):
+                if speeds[i] > junction_speed: speeds[i] = junction_speed
+
+        # Braking ahead of each slow bin, then accelerating out of it: v² changes by at most 2as
+        step = 2 * acceleration * self.bin_size
+        for i in range(bins - 2, -1, -1):
+            reachable = sqrt(speeds[i + 1] * speeds[i + 1] + step)
+            if speeds[i] > reachable: speeds[i] = reachable
+        for i in range(1, bins):
+            reachable = sqrt(speeds[i - 1] * speeds[i - 1] + step)
+            if speeds[i] > reachable: speeds[i] = reachable
+        self.speeds = array("H", [int(speed) for speed in speeds])
+        self.lead_bins = lead // self.bin_size
+        self.recording = False
+        self._sums = None
+        self._counts = None
+
+    def save(self, path):
+        """
+        Writes a planned map to `path`.
+
+        Layout, little-endian: magic "EVTM", u16 version, u16 bin size, u16 bin count, u16 lead
+        in bins, u16 junction count, then the curvature (i16), speeds (u16) and junction bins (u16).
+        """
+        if self.recording:
+            raise ValueError("Only a planned TrackMap can be saved.")
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sHHHHH", self.MAGIC, self.VERSION, self.bin_size, self.bins,
+                                self.lead_bins, len(self.junctions)))
+            f.write(self.curvature)
+            f.write(self.speeds)
+            f.write(array("H", self.junctions))
+
+    @classmethod
+    def load(cls, path):
+        """Reads a map written by save()."""
+        with open(path, "rb") as f:
+            magic, version, bin_size, bins, lead_bins, junctions = struct.unpack("<4sHHHHH", f.read(14))
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ValueError("{} is not a version {} track map.".format(path, cls.VERSION))
+            track = cls((bins - 1) * bin_size, bin_size)
+            track.curvature = array("h", f.read(2 * bins))
+            track.speeds = array("H", f.read(2 * bins))
+            track.junctions = list(array("H", f.read(2 * junctions)))
+        track.lead_bins = lead_bins
+        track.recording = False
+        track._sums = None
+        track._counts = None
+        return track
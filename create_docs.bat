@@ -1,5 +1,5 @@
 @echo off
 pip install pdoc
 cd /d "%~dp0.\code"
-python -m pdoc evpylib.py -o ../docs
+python -m pdoc evpylib.py motion.py control.py routine.py snapshot.py colour.py trackmap.py diagnostics.py -o ../docs
 pause
\ No newline at end of file